@@ -2,6 +2,15 @@ from quart import Quart, request, jsonify
 from quart_cors import cors
 from quart_rate_limiter import RateLimiter, rate_limit
 from korpotlumacz import KorpoTlumacz, TranslatorState
+from app.core.batching import batch_embedder_stats
+from app.core.embeddings import DEFAULT_EMBEDDING_MODEL, embedding_registry, get_embedding_model
+from app.core.executors import bulk_executor, executor_stats
+from app.core.llm import llm_client_stats, shared_http_client
+from app.core.tasks import TASK_TRANSLATE
+from app.services.naming import deferred_names
+from app.services.reload import CorpusReloader
+from app.services.retrieval import RetrievalEngine, UnsavedChangesError, get_shared_retrieval
+import hmac
 import os
 from functools import wraps
 import logging
@@ -49,6 +58,35 @@ app = cors(app,
 )
 limiter = RateLimiter(app)
 
+# Hot reload korpusu: nowy index budowany w tle i podmieniany we wszystkich tłumaczach
+def build_corpus_engine(version: int):
+    return bulk_executor.run(
+        lambda: RetrievalEngine.build_from_file(
+            str(DATABASE_PATH), get_embedding_model(DEFAULT_EMBEDDING_MODEL),
+            DEFAULT_EMBEDDING_MODEL, version=version,
+            index_kind=os.getenv('RETRIEVAL_INDEX_KIND', 'auto')))
+
+corpus_reloader = CorpusReloader(
+    str(DATABASE_PATH), get_shared_retrieval(str(DATABASE_PATH)), build_corpus_engine,
+    interval=float(os.getenv('CORPUS_WATCH_INTERVAL', '10')))
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN')
+
+@app.before_serving
+async def start_corpus_watch():
+    corpus_reloader.start()
+
+@app.after_serving
+async def stop_corpus_watch():
+    await corpus_reloader.stop()
+
+@app.after_serving
+async def cancel_deferred_names():
+    await deferred_names.aclose()
+
+@app.after_serving
+async def close_llm_connections():
+    await shared_http_client.aclose()
+
 # Konfiguracja loggera
 logging.basicConfig(
     level=logging.INFO,
@@ -132,13 +170,56 @@ def require_api_key():
 
 @app.route('/api/health')
 async def health_check():
+    retrieval = get_shared_retrieval(str(DATABASE_PATH))
     return jsonify({
         'status': 'ok',
         'version': '1.0.0',
         'database_exists': os.path.exists(DATABASE_PATH),
-        'active_translators': len(translator_instances)
+        'active_translators': len(translator_instances),
+        'embedding_models': embedding_registry.stats(),
+        'embedding_batchers': batch_embedder_stats(),
+        'llm': llm_client_stats(),
+        'deferred_names': deferred_names.stats(),
+        'retrieval': {
+            'version': retrieval.version,
+            'result_cache': retrieval.results.stats(),
+            'reload': corpus_reloader.stats()
+        },
+        'executors': executor_stats()
     })
 
+@app.route('/api/admin/reload', methods=['POST'])
+async def reload_corpus():
+    token = request.headers.get('X-Admin-Token', '')
+    if not ADMIN_API_TOKEN or not hmac.compare_digest(token, ADMIN_API_TOKEN):
+        return jsonify({
+            'status': 'error',
+            'message': 'Brak uprawnień',
+            'code': 'forbidden'
+        }), 403
+
+    try:
+        # force=1 odrzuca niezapisane zmiany bieżącego indexu
+        result = await corpus_reloader.reload(force=request.args.get('force') == '1')
+        return jsonify({
+            'status': 'success',
+            'data': result
+        })
+    except UnsavedChangesError as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Index ma niezapisane zmiany',
+            'code': 'unsaved_changes',
+            'details': str(e)
+        }), 409
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': 'Błąd podczas przeładowania korpusu',
+            'code': 'reload_error',
+            'details': str(e)
+        }), 500
+
 @app.route('/api/translate', methods=['POST'])
 @require_api_key()
 async def translate():
@@ -165,6 +246,22 @@ async def translate():
         text = data['text']
         direction = data['direction']
         context = data.get('context', '')
+        # Tłumaczenie i nazwa jednym zapytaniem (None = ustawienie tłumacza)
+        combined_naming = data.get('combined_naming')
+        if combined_naming is not None and not isinstance(combined_naming, bool):
+            return jsonify({
+                'status': 'error',
+                'message': 'Pole combined_naming musi mieć wartość true lub false',
+                'code': 'invalid_field'
+            }), 400
+        # Odpowiedź bez czekania na nazwę - nazwa do pobrania z /api/translations/<id>/name
+        defer_name = data.get('defer_name', False)
+        if not isinstance(defer_name, bool):
+            return jsonify({
+                'status': 'error',
+                'message': 'Pole defer_name musi mieć wartość true lub false',
+                'code': 'invalid_field'
+            }), 400
 
         if direction not in ['to_human', 'to_korpo']:
             return jsonify({
@@ -188,16 +285,16 @@ async def translate():
             
             # Execute translation
             if direction == 'to_human':
-                result = await translator.translate_to_human(text, context)
+                result = await translator.translate_to_human(text, context, combined_naming, defer_name)
             else:
-                result = await translator.translate_to_korpo(text, context)
+                result = await translator.translate_to_korpo(text, context, combined_naming, defer_name)
                 
             # Log success
             end_time = time.time()
             span.end(
                 output=result,
                 metadata={
-                    'model': 'gpt-4',
+                    'model': translator.model_for(TASK_TRANSLATE),
                     'duration_ms': int((end_time - start_time) * 1000)
                 }
             )
@@ -215,7 +312,7 @@ async def translate():
                 span.end(
                     error=str(e),
                     metadata={
-                        'model': 'gpt-4',
+                        'model': translator.model_for(TASK_TRANSLATE),
                         'duration_ms': int((error_time - start_time) * 1000)
                     },
                     status='error'
@@ -250,6 +347,22 @@ async def translate():
             'details': str(e)
         }), 500
 
+@app.route('/api/translations/<translation_id>/name')
+@require_api_key()
+async def get_translation_name(translation_id: str):
+    result = deferred_names.get(translation_id, request.headers['X-API-Key'])
+    if result is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'Nie znaleziono tłumaczenia',
+            'code': 'translation_not_found'
+        }), 404
+
+    return jsonify({
+        'status': 'success',
+        'data': result
+    })
+
 if __name__ == '__main__':
     import hypercorn.asyncio
     import asyncio
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.cache import LRUCache, normalize_query
+from app.core.embeddings import DEFAULT_EMBEDDING_MODEL, get_embedding_model
+from app.core.executors import BoundedExecutor, cpu_executor
+
+
+class MicroBatchEmbedder:
+    """
+    Coalesces concurrent single-text encode requests into batched calls.
+
+    Requests are collected until `max_batch_size` texts are pending or
+    `max_wait_ms` has passed since the first one, then encoded with a single
+    `embed_model.encode` on the executor; each caller gets its own row back.
+    Texts already seen (after normalization) are served from `cache` and never
+    reach the model.
+    """
+
+    def __init__(self, embed_model, executor: BoundedExecutor,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 cache: Optional[LRUCache] = None):
+        self.embed_model = embed_model
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache = cache
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Returns the embedding of a single text, encoded together with concurrent requests"""
+        if self.cache is not None:
+            key = normalize_query(text)
+            embedding = self.cache.get(key)
+            if embedding is not None:
+                return embedding
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        embedding = await future
+        if self.cache is not None:
+            self.cache.put(key, embedding)
+        return embedding
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._encode_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        self._batches += 1
+        self._items += len(batch)
+        self._largest_batch = max(self._largest_batch, len(batch))
+
+        try:
+            embeddings = await self.executor.run(
+                self.embed_model.encode, [text for text, _ in batch])
+            embeddings = np.asarray(embeddings, dtype='float32')
+        except Exception as e:
+            logging.error(f"Batched encoding of {len(batch)} texts failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for row, (_, future) in enumerate(batch):
+            # Caller may have been cancelled while the batch was encoding
+            if not future.done():
+                future.set_result(embeddings[row])
+
+    def stats(self) -> Dict:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'pending': len(self._pending),
+            'batches': self._batches,
+            'items': self._items,
+            'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+            'largest_batch': self._largest_batch,
+            'cache': self.cache.stats() if self.cache is not None else None,
+        }
+
+
+EMBED_BATCH_MAX_SIZE = int(os.getenv('EMBED_BATCH_MAX_SIZE', '32'))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '5'))
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '10000'))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', '3600'))
+
+_batch_embedders: Dict[str, MicroBatchEmbedder] = {}
+_batch_embedders_lock = threading.Lock()
+
+
+def get_batch_embedder(model_name: Optional[str] = None) -> MicroBatchEmbedder:
+    """Returns the process-wide batching embedder for the given model"""
+    model_name = model_name or DEFAULT_EMBEDDING_MODEL
+    with _batch_embedders_lock:
+        embedder = _batch_embedders.get(model_name)
+        if embedder is None:
+            embedder = _batch_embedders[model_name] = MicroBatchEmbedder(
+                get_embedding_model(model_name), cpu_executor,
+                max_batch_size=EMBED_BATCH_MAX_SIZE,
+                max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+                cache=LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL))
+        return embedder
+
+
+def batch_embedder_stats() -> Dict[str, Dict]:
+    with _batch_embedders_lock:
+        return {name: embedder.stats() for name, embedder in _batch_embedders.items()}
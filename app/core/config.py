@@ -1,5 +1,7 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
+
+from app.core.tasks import DEFAULT_TASK_MODELS, parse_task_models
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "KorpoTlumacz API"
@@ -27,6 +29,11 @@ class Settings(BaseSettings):
     # OpenAI
     OPENAI_API_KEY: str
     OPENAI_MODEL: str = "gpt-4"
+    # Per-task model overrides as "task=model,...", e.g. "name=gpt-4o-mini"; other tasks
+    # use OPENAI_MODEL. The Quart app reads the same variable
+    LLM_TASK_MODELS: str = DEFAULT_TASK_MODELS
+    # Translation and name from one completion by default; also read by the Quart app
+    COMBINED_NAMING: bool = False
     
     # Langfuse
     LANGFUSE_PUBLIC_KEY: str
@@ -40,6 +47,13 @@ class Settings(BaseSettings):
     # Translator settings
     TRANSLATOR_CACHE_TIMEOUT: int = 3600  # 1 hour
     
+    @property
+    def OPENAI_TASK_MODELS(self) -> Dict[str, str]:
+        return parse_task_models(self.LLM_TASK_MODELS)
+
+    def model_for(self, task: str) -> str:
+        return self.OPENAI_TASK_MODELS.get(task, self.OPENAI_MODEL)
+
     class Config:
         env_file = ".env"
         case_sensitive = True
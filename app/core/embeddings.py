@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+
+class EmbeddingModelRegistry:
+    """
+    Process-wide registry of SentenceTransformer models.
+
+    Each model is loaded exactly once and shared by every translator and
+    service instance, so the number of API keys does not affect memory usage.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, SentenceTransformer] = {}
+        self._load_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> SentenceTransformer:
+        """Returns the shared model, loading it on first use"""
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Per-model lock so loading one model does not block lookups of others
+        with load_lock:
+            model = self._models.get(model_name)
+            if model is not None:
+                return model
+
+            start = time.perf_counter()
+            model = SentenceTransformer(model_name)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._models[model_name] = model
+                self._load_times[model_name] = elapsed
+
+            logging.info(
+                f"Loaded embedding model {model_name} in {elapsed:.2f}s "
+                f"({self.model_size_bytes(model) / 2**20:.1f} MB)")
+            return model
+
+    def is_loaded(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> bool:
+        return model_name in self._models
+
+    @staticmethod
+    def model_size_bytes(model: SentenceTransformer) -> int:
+        """Size of the model weights and buffers in bytes"""
+        size = sum(p.numel() * p.element_size() for p in model.parameters())
+        size += sum(b.numel() * b.element_size() for b in model.buffers())
+        return size
+
+    def stats(self) -> Dict[str, Dict]:
+        """Memory footprint and load time of every loaded model"""
+        with self._lock:
+            models = dict(self._models)
+            load_times = dict(self._load_times)
+
+        return {
+            name: {
+                'memory_bytes': self.model_size_bytes(model),
+                'load_seconds': round(load_times.get(name, 0.0), 3),
+            }
+            for name, model in models.items()
+        }
+
+    def total_memory_bytes(self) -> int:
+        return sum(s['memory_bytes'] for s in self.stats().values())
+
+
+embedding_registry = EmbeddingModelRegistry()
+
+
+def get_embedding_model(model_name: Optional[str] = None) -> SentenceTransformer:
+    """Returns the process-wide shared embedding model"""
+    return embedding_registry.get(model_name or DEFAULT_EMBEDDING_MODEL)
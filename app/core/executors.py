@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+# A saturated lane is logged at most once per this many seconds
+SATURATION_LOG_INTERVAL = float(os.getenv('EXECUTOR_SATURATION_LOG_INTERVAL', '30'))
+
+
+class _Lane:
+    """Shared bookkeeping of a named lane: a lock and rate-limited saturation warnings"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._saturated = 0
+        self._last_saturation_log = 0.0
+
+    def _note_saturation(self, details: str):
+        now = time.monotonic()
+        with self._lock:
+            self._saturated += 1
+            if now - self._last_saturation_log < SATURATION_LOG_INTERVAL:
+                return
+            self._last_saturation_log = now
+            count = self._saturated
+        logging.warning(f"Executor '{self.name}' saturated ({count} times so far): {details}")
+
+
+class BoundedExecutor(_Lane):
+    """
+    Thread pool for blocking work with a bounded queue and its own metrics.
+
+    At most `max_workers` tasks run and at most `max_queue` wait for a worker;
+    further callers are suspended on the event loop until a slot frees up,
+    so a burst of work applies backpressure instead of growing without bound.
+    Callers having to wait for a slot is logged as saturation.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        super().__init__(name)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._queued = 0
+        self._running = 0
+        self._waiting = 0
+        self._peak_queued = 0
+        self._queue_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Runs fn(*args, **kwargs) on the pool and awaits its result"""
+        slots = self._get_slots()
+
+        if slots.locked():
+            self._note_saturation(
+                f"{self._running} running, {self._queued} queued, {self._waiting + 1} waiting for a slot")
+        with self._lock:
+            self._waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        try:
+            enqueued_at = time.perf_counter()
+            with self._lock:
+                self._submitted += 1
+                self._queued += 1
+                self._peak_queued = max(self._peak_queued, self._queued)
+
+            def task():
+                started_at = time.perf_counter()
+                with self._lock:
+                    self._queued -= 1
+                    self._running += 1
+                    self._queue_seconds += started_at - enqueued_at
+                failed = False
+                try:
+                    return fn(*args, **kwargs)
+                except BaseException:
+                    failed = True
+                    raise
+                finally:
+                    with self._lock:
+                        self._running -= 1
+                        self._run_seconds += time.perf_counter() - started_at
+                        if failed:
+                            self._failed += 1
+                        else:
+                            self._completed += 1
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, task)
+        finally:
+            slots.release()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': self._running,
+                'queued': self._queued,
+                'waiting': self._waiting,
+                'peak_queued': self._peak_queued,
+                'saturated': self._saturated,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'avg_queue_ms': round(1000 * self._queue_seconds / finished, 2) if finished else 0.0,
+                'avg_run_ms': round(1000 * self._run_seconds / finished, 2) if finished else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+class AsyncSlotLimiter(_Lane):
+    """
+    Concurrency lane for async I/O: at most `max_concurrency` coroutines run
+    at once, the rest wait on the event loop. No threads are involved; it has
+    the same queue metrics and saturation logging as BoundedExecutor.
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        super().__init__(name)
+        self.max_concurrency = max_concurrency
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._running = 0
+        self._waiting = 0
+        self._peak_waiting = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    async def run(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Awaits fn(*args, **kwargs) once a slot is free"""
+        slots = self._get_slots()
+
+        if slots.locked():
+            self._note_saturation(f"{self._running} running, {self._waiting + 1} waiting")
+        enqueued_at = time.perf_counter()
+        with self._lock:
+            self._submitted += 1
+            self._waiting += 1
+            self._peak_waiting = max(self._peak_waiting, self._waiting)
+        try:
+            await slots.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        started_at = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._wait_seconds += started_at - enqueued_at
+        failed = False
+        try:
+            return await fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            slots.release()
+            with self._lock:
+                self._running -= 1
+                self._run_seconds += time.perf_counter() - started_at
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                'max_concurrency': self.max_concurrency,
+                'running': self._running,
+                'waiting': self._waiting,
+                'peak_waiting': self._peak_waiting,
+                'saturated': self._saturated,
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'avg_wait_ms': round(1000 * self._wait_seconds / finished, 2) if finished else 0.0,
+                'avg_run_ms': round(1000 * self._run_seconds / finished, 2) if finished else 0.0,
+            }
+
+
+# Encoding and search are CPU-bound and torch already parallelises a single
+# forward pass, so a couple of workers is enough; the rest waits in the queue
+cpu_executor = BoundedExecutor(
+    'cpu',
+    max_workers=int(os.getenv('CPU_EXECUTOR_WORKERS', '2')),
+    max_queue=int(os.getenv('CPU_EXECUTOR_QUEUE', '64')),
+)
+
+# Encoding whole corpora or batches of new examples (loads, reloads,
+# imports, directory ingestion): long-running, kept off the cpu lane so a
+# bulk job never queues ahead of query encoding and search
+bulk_executor = BoundedExecutor(
+    'bulk',
+    max_workers=int(os.getenv('BULK_EXECUTOR_WORKERS', '1')),
+    max_queue=int(os.getenv('BULK_EXECUTOR_QUEUE', '16')),
+)
+
+# File I/O without encoding: corpus saves, journal appends, artifact
+# snapshots, reading import batches
+disk_executor = BoundedExecutor(
+    'disk',
+    max_workers=int(os.getenv('DISK_EXECUTOR_WORKERS', '2')),
+    max_queue=int(os.getenv('DISK_EXECUTOR_QUEUE', '16')),
+)
+
+# LLM calls are native async (see app.core.llm), so this lane caps in-flight
+# completions across all keys without holding a thread per call
+llm_limiter = AsyncSlotLimiter(
+    'llm',
+    max_concurrency=int(os.getenv('LLM_EXECUTOR_CONCURRENCY', '128')),
+)
+
+
+def executor_stats() -> Dict:
+    return {
+        'cpu': cpu_executor.stats(),
+        'bulk': bulk_executor.stats(),
+        'disk': disk_executor.stats(),
+        'llm': llm_limiter.stats(),
+    }
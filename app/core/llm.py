@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.core.cache import api_key_digest
+from app.core.executors import llm_limiter
+
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '200'))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '50'))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '60'))
+LLM_HTTP2 = os.getenv('LLM_HTTP2', '1') == '1'
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_MAX_CONCURRENCY_PER_KEY = int(os.getenv('LLM_MAX_CONCURRENCY_PER_KEY', '32'))
+# Per-key clients unused for this long are dropped (same as the translator cache timeout);
+# the registry never holds more than LLM_CLIENT_CACHE_SIZE idle ones
+LLM_CLIENT_IDLE_TTL = float(os.getenv('LLM_CLIENT_IDLE_TTL', '3600'))
+LLM_CLIENT_CACHE_SIZE = int(os.getenv('LLM_CLIENT_CACHE_SIZE', '1000'))
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _SharedHttpClient:
+    """
+    One httpx.AsyncClient (connection pool) per event loop, shared by the
+    OpenAI clients of all API keys, so keep-alive connections and HTTP/2
+    streams to the API are reused across keys and requests.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._client is None or self._loop is not loop or self._client.is_closed:
+                http2 = LLM_HTTP2 and _http2_available()
+                if LLM_HTTP2 and not http2:
+                    logging.warning("HTTP/2 requested for LLM calls but 'h2' is not installed, using HTTP/1.1")
+                self._client = httpx.AsyncClient(
+                    http2=http2,
+                    timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY))
+                self._loop = loop
+            return self._client
+
+    async def aclose(self):
+        with self._lock:
+            client, self._client, self._loop = self._client, None, None
+        if client is not None:
+            await client.aclose()
+
+
+shared_http_client = _SharedHttpClient()
+
+
+class LLMClient:
+    """
+    Async OpenAI client of one API key on top of the shared connection pool.
+    At most `max_concurrency` completions per key are in flight; further
+    calls wait for a slot instead of opening more connections. Every call
+    also goes through the process-wide 'llm' lane (app.core.executors).
+    """
+
+    def __init__(self, api_key: str, max_concurrency: int = LLM_MAX_CONCURRENCY_PER_KEY):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._openai: Optional[AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.in_flight or self.waiting)
+
+    def _client(self) -> AsyncOpenAI:
+        http_client = shared_http_client.get()
+        if self._openai is None or self._http_client is not http_client:
+            self._openai = AsyncOpenAI(api_key=self.api_key, http_client=http_client)
+            self._http_client = http_client
+        return self._openai
+
+    async def create_chat_completion(self, **kwargs):
+        """chat.completions.create with the per-key and process-wide concurrency caps"""
+        self.last_used = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            response = await llm_limiter.run(self._client().chat.completions.create, **kwargs)
+            self.completed += 1
+            return response
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+
+# Keyed by a hash of the API key, least recently used first
+_llm_clients: "OrderedDict[str, LLMClient]" = OrderedDict()
+_llm_clients_lock = threading.Lock()
+_evicted = {'clients': 0, 'completed': 0, 'failed': 0}
+
+
+def _evict_idle_clients(now: float):
+    """Drops clients idle past the TTL, then the oldest idle ones over the size limit"""
+    for key, client in list(_llm_clients.items()):
+        if client.busy:
+            continue
+        if now - client.last_used > LLM_CLIENT_IDLE_TTL or len(_llm_clients) > LLM_CLIENT_CACHE_SIZE:
+            del _llm_clients[key]
+            _evicted['clients'] += 1
+            _evicted['completed'] += client.completed
+            _evicted['failed'] += client.failed
+
+
+def get_llm_client(api_key: str) -> LLMClient:
+    """
+    Returns the process-wide LLMClient of the API key. Clients idle for
+    LLM_CLIENT_IDLE_TTL are evicted, so keys that stop calling do not stay
+    in memory; a translator still holding an evicted client keeps working.
+    """
+    key = api_key_digest(api_key)
+    now = time.monotonic()
+    with _llm_clients_lock:
+        client = _llm_clients.get(key)
+        if client is None:
+            client = _llm_clients[key] = LLMClient(api_key)
+        client.last_used = now
+        _llm_clients.move_to_end(key)
+        _evict_idle_clients(now)
+        return client
+
+
+def llm_client_stats() -> Dict:
+    with _llm_clients_lock:
+        _evict_idle_clients(time.monotonic())
+        clients = list(_llm_clients.values())
+        evicted = dict(_evicted)
+    return {
+        'keys': len(clients),
+        'evicted_keys': evicted['clients'],
+        'in_flight': sum(c.in_flight for c in clients),
+        'waiting': sum(c.waiting for c in clients),
+        'completed': evicted['completed'] + sum(c.completed for c in clients),
+        'failed': evicted['failed'] + sum(c.failed for c in clients),
+        'max_connections': LLM_MAX_CONNECTIONS,
+        'http2': LLM_HTTP2 and _http2_available(),
+    }
@@ -0,0 +1,72 @@
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+# Tasks routed to their own model; a task without an entry uses the caller's default model
+TASK_TRANSLATE = 'translate'
+TASK_NAME = 'name'
+
+# Naming is a short creative prompt, so it goes to a fast, cheap model by default
+DEFAULT_TASK_MODELS = 'name=gpt-4o-mini'
+
+
+def parse_task_models(spec: str) -> Dict[str, str]:
+    """'translate=gpt-4,name=gpt-4o-mini' -> {'translate': 'gpt-4', 'name': 'gpt-4o-mini'}"""
+    models = {}
+    for item in spec.split(','):
+        task, sep, model = item.partition('=')
+        if not sep or not task.strip() or not model.strip():
+            if item.strip():
+                logging.warning(f"Ignoring malformed LLM_TASK_MODELS entry: {item!r}")
+            continue
+        models[task.strip()] = model.strip()
+    return models
+
+
+def parse_json_reply(content: str, fields: Sequence[str]) -> Optional[Dict[str, str]]:
+    """
+    Reads a JSON object from a completion that was asked to answer with one.
+    Tolerates code fences and text around the object; returns None unless
+    every field in `fields` is a non-empty string.
+    """
+    content = (content or '').strip()
+    if content.startswith('```'):
+        content = content.strip('`')
+        if content.startswith('json'):
+            content = content[4:]
+    start, end = content.find('{'), content.rfind('}')
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(content[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if not all(isinstance(data.get(field), str) and data[field].strip() for field in fields):
+        return None
+    return {field: data[field].strip() for field in fields}
+
+
+def clean_name(name: str) -> str:
+    """Translation names come back quoted or escaped now and then"""
+    return name.replace('"', '').replace('\\', '')
+
+
+async def translate_and_name(translate: Callable[[Optional[str]], Awaitable[str]],
+                             name: Callable[[str], Awaitable[str]],
+                             combined_instructions: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Returns (translation, name). `translate(extra_instructions)` runs the
+    translation completion, `name(translation)` the separate naming one.
+    With `combined_instructions` a single completion is asked for both as
+    JSON; the two calls are only made when that answer cannot be parsed.
+    """
+    if combined_instructions is not None:
+        reply = parse_json_reply(await translate(combined_instructions), ('translation', 'name'))
+        if reply is not None:
+            return reply['translation'], clean_name(reply['name'])
+        logging.warning("Could not parse the combined translation and name, using two calls")
+
+    translation = await translate(None)
+    return translation, clean_name(await name(translation))
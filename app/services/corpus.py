@@ -0,0 +1,637 @@
+"""
+Example corpus files.
+
+Format v1 is a plain list of examples, each with its own `context` list of
+dialog lines. Consecutive examples from one transcript repeat most of those
+lines, so format v2 stores every dialog once and examples reference their
+context as a `(dialog_id, start, end)` span:
+
+    {"format_version": 2,
+     "dialogs": [["[Pracodawca]: ...", "[Korpotłumacz]: ...", ...], ...],
+     "examples": [{"id": 0, "korpo": "...", "human": "...",
+                   "dialog_id": 0, "start": 0, "end": 4}, ...]}
+
+The binary format (`*.kbin`) holds the same data as columns: a JSON header
+with the section layout followed by 64-byte aligned raw arrays (ids, dialog
+spans, per-field text offsets, UTF-8 data and digests, dialog lines). It is
+opened through mmap, so a large corpus opens instantly, its pages are shared
+between worker processes, and only the pages of examples that are actually
+used get read.
+
+All formats are read (the binary one is recognized by its magic bytes); the
+output format follows the file suffix. Convert an existing file with
+
+    python -m app.services.corpus korpotlumacz_database.json [output.json|output.kbin]
+"""
+import functools
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.services.example_store import ExampleStore, StringPool, assign_ids
+
+CORPUS_FORMAT_VERSION = 2
+SPAN_FIELDS = ('dialog_id', 'start', 'end')
+
+STREAM_CHUNK_SIZE = 1 << 20
+LOAD_BATCH_SIZE = 10_000
+
+JOURNAL_FORMAT_VERSION = 1
+
+BINARY_SUFFIX = '.kbin'
+BINARY_MAGIC = b'KTCORPUS'
+BINARY_FORMAT_VERSION = 1
+_ALIGNMENT = 64
+
+
+class _MappedDialogs(Sequence):
+    """Read-only dialogs of a binary corpus followed by the dialogs added since"""
+
+    def __init__(self, lines: StringPool, starts: np.ndarray):
+        self._lines = lines
+        self._starts = starts
+        self._added: List[List[str]] = []
+
+    def __len__(self) -> int:
+        return len(self._starts) - 1 + len(self._added)
+
+    def __getitem__(self, dialog_id: int) -> List[str]:
+        if dialog_id < 0:
+            dialog_id += len(self)
+        mapped = len(self._starts) - 1
+        if dialog_id >= mapped:
+            return self._added[dialog_id - mapped]
+        return [self._lines[row] for row in
+                range(int(self._starts[dialog_id]), int(self._starts[dialog_id + 1]))]
+
+    def append(self, dialog: List[str]):
+        self._added.append(dialog)
+
+
+class DialogStore:
+    """
+    Deduplicated dialog lines referenced by example context spans.
+    Context is only materialized (sliced) when an example is used.
+    """
+
+    def __init__(self, dialogs: Optional[List[List[str]]] = None):
+        self.dialogs: Union[List[List[str]], _MappedDialogs] = [list(d) for d in dialogs or []]
+        # Line -> positions in the newest dialog, the only one that still grows;
+        # built on first use
+        self._positions: Optional[Dict[str, List[int]]] = None
+        self._growable = bool(self.dialogs)
+
+    @classmethod
+    def from_sections(cls, sections: Dict) -> "DialogStore":
+        """Opens the dialogs of a binary corpus; mapped dialogs are never extended"""
+        store = cls()
+        store.dialogs = _MappedDialogs(
+            StringPool.wrap(sections['dialogs.lines.offsets'], sections['dialogs.lines.data']),
+            sections['dialogs.starts'])
+        return store
+
+    def sections(self) -> Dict:
+        lines = StringPool()
+        starts = [0]
+        for dialog in self.dialogs:
+            lines.extend(dialog)
+            starts.append(starts[-1] + len(dialog))
+        offsets, data = lines.sections()
+        return {
+            'dialogs.lines.offsets': offsets,
+            'dialogs.lines.data': data,
+            'dialogs.starts': np.array(starts, dtype='int64'),
+        }
+
+    def __len__(self) -> int:
+        return len(self.dialogs)
+
+    def line_count(self) -> int:
+        return sum(len(d) for d in self.dialogs)
+
+    def add_dialog(self, lines: List[str]):
+        """Appends a complete dialog as the newest one; the list is taken over, not copied"""
+        self.dialogs.append(lines)
+        self._positions = None
+        self._growable = True
+
+    def _index_positions(self, lines: List[str], offset: int):
+        for position, line in enumerate(lines, offset):
+            self._positions.setdefault(line, []).append(position)
+
+    def _place(self, context: List[str]) -> Tuple[int, int]:
+        """Returns (dialog_id, start) of the context, extending or starting a dialog as needed"""
+        if self._growable:
+            dialog = self.dialogs[-1]
+            if self._positions is None:
+                self._positions = {}
+                self._index_positions(dialog, 0)
+            # Latest occurrence first - sliding windows continue near the end
+            for start in reversed(self._positions.get(context[0], ())):
+                overlap = min(len(dialog) - start, len(context))
+                if dialog[start:start + overlap] == context[:overlap]:
+                    tail = context[overlap:]
+                    self._index_positions(tail, len(dialog))
+                    dialog.extend(tail)
+                    return len(self.dialogs) - 1, start
+
+        self.dialogs.append(list(context))
+        self._growable = True
+        self._positions = {}
+        self._index_positions(context, 0)
+        return len(self.dialogs) - 1, 0
+
+    def intern(self, examples: Iterable[Dict]) -> List[Dict]:
+        """Returns the examples with inline `context` lists replaced by dialog spans"""
+        result = []
+        for ex in examples:
+            if 'context' not in ex:
+                result.append(ex)
+                continue
+            ex = dict(ex)
+            context = ex.pop('context')
+            if context:
+                dialog_id, start = self._place(context)
+                ex.update(dialog_id=dialog_id, start=start, end=start + len(context))
+            result.append(ex)
+        return result
+
+    def context(self, example: Dict) -> List[str]:
+        if 'context' in example:
+            return example['context']
+        dialog_id = example.get('dialog_id')
+        if dialog_id is None:
+            return []
+        return self.dialogs[dialog_id][example['start']:example['end']]
+
+    def materialize(self, example: Dict) -> Dict:
+        """Returns a copy of the example with its `context` list instead of the span"""
+        ex = {k: v for k, v in example.items() if k not in SPAN_FIELDS}
+        ex['context'] = self.context(example)
+        return ex
+
+    def export(self, examples: Iterable[Dict]) -> Dict:
+        """Builds a v2 document holding only the dialogs the given examples reference"""
+        dialogs: List[List[str]] = []
+        remap: Dict[int, int] = {}
+        records = []
+        for ex in examples:
+            record = {k: v for k, v in ex.items() if k != 'context' and k not in SPAN_FIELDS}
+            if 'context' in ex:
+                if ex['context']:
+                    dialogs.append(list(ex['context']))
+                    record.update(dialog_id=len(dialogs) - 1, start=0, end=len(ex['context']))
+            elif ex.get('dialog_id') is not None:
+                dialog_id = remap.get(ex['dialog_id'])
+                if dialog_id is None:
+                    dialog_id = remap[ex['dialog_id']] = len(dialogs)
+                    # Copied: the newest dialog keeps growing as examples are added
+                    dialogs.append(list(self.dialogs[ex['dialog_id']]))
+                record.update(dialog_id=dialog_id, start=ex['start'], end=ex['end'])
+            records.append(record)
+        return {'format_version': CORPUS_FORMAT_VERSION, 'dialogs': dialogs, 'examples': records}
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def write_binary_corpus(file_path: str, examples: ExampleStore, dialogs: DialogStore):
+    """Writes the binary corpus atomically (temporary file + rename)"""
+    sections, extras = examples.sections()
+    sections.update(dialogs.sections())
+    _write_binary_sections(file_path, sections, extras)
+
+
+def _write_binary_sections(file_path: str, sections: Dict, extras: Dict[int, Dict]):
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        offset = _aligned(offset)
+        if isinstance(data, np.ndarray):
+            layout[name] = {'dtype': data.dtype.str, 'offset': offset, 'count': len(data)}
+            offset += data.nbytes
+        else:
+            layout[name] = {'dtype': 'bytes', 'offset': offset, 'count': len(data)}
+            offset += len(data)
+
+    header = json.dumps({
+        'format_version': BINARY_FORMAT_VERSION,
+        'count': len(sections['ids']),
+        'sections': layout,
+        'extras': {str(row): extra for row, extra in extras.items()},
+    }, ensure_ascii=False).encode('utf-8')
+    body_start = _aligned(len(BINARY_MAGIC) + 8 + len(header))
+
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(BINARY_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, data in sections.items():
+            f.write(b'\0' * (body_start + layout[name]['offset'] - f.tell()))
+            f.write(data.tobytes() if isinstance(data, np.ndarray) else data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def read_binary_corpus(file_path: str) -> Tuple[ExampleStore, DialogStore]:
+    """Memory-maps a binary corpus; the columns are views of the mapping"""
+    with open(file_path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapping[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError(f"{file_path} is not a binary corpus")
+    header_size, = struct.unpack_from('<Q', mapping, len(BINARY_MAGIC))
+    header_start = len(BINARY_MAGIC) + 8
+    header = json.loads(mapping[header_start:header_start + header_size].decode('utf-8'))
+    if header.get('format_version') != BINARY_FORMAT_VERSION:
+        raise ValueError(f"Unsupported binary corpus format: {header.get('format_version')}")
+
+    body_start = _aligned(header_start + header_size)
+    view = memoryview(mapping)
+    sections = {}
+    for name, section in header['sections'].items():
+        start = body_start + section['offset']
+        if section['dtype'] == 'bytes':
+            sections[name] = view[start:start + section['count']]
+        else:
+            sections[name] = np.frombuffer(
+                mapping, dtype=section['dtype'], count=section['count'], offset=start)
+
+    extras = {int(row): extra for row, extra in header.get('extras', {}).items()}
+    return ExampleStore.from_sections(sections, extras), DialogStore.from_sections(sections)
+
+
+def is_binary_corpus(file_path: str) -> bool:
+    with open(file_path, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+class _JsonStream:
+    """
+    Incremental reader of one JSON document: values are decoded with
+    `raw_decode` from a buffer refilled in chunks, so arrays can be walked
+    element by element without holding the whole document.
+    """
+
+    _WHITESPACE = re.compile(r'\s*')
+
+    def __init__(self, f, chunk_size: int = STREAM_CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def take(self) -> str:
+        """Consumes and returns the next non-whitespace character"""
+        char = self.peek()
+        self._pos += 1
+        return char
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, got {self.peek()!r}")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def items(self) -> Iterator:
+        """Yields the elements of the array starting at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.take()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f"Malformed JSON array: unexpected {separator!r}")
+
+
+def iter_corpus_records(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[str, object]]:
+    """
+    Streams a JSON corpus as ('dialog', lines) and ('example', dict) records
+    in file order; v2 files list their dialogs before the examples.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        if stream.peek() == '[':
+            for example in stream.items():
+                yield 'example', example
+            return
+
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'dialogs':
+                for dialog in stream.items():
+                    yield 'dialog', dialog
+            elif key == 'examples':
+                for example in stream.items():
+                    yield 'example', example
+            elif key == 'format_version':
+                version = stream.value()
+                if version != CORPUS_FORMAT_VERSION:
+                    raise ValueError(f"Unsupported corpus format: {version}")
+            else:
+                stream.value()
+            separator = stream.take()
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Malformed JSON object: unexpected {separator!r}")
+
+
+class _SpilledDialogs:
+    """
+    Dialogs of a v2 file spilled to an anonymous temporary file, one JSON
+    line each, with only their byte offsets kept in memory. The last dialog
+    read is cached, since consecutive examples usually share one.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._offsets = array('q', [0])
+        self._cached: Tuple[Optional[int], Optional[List[str]]] = (None, None)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def append(self, dialog: List[str]):
+        data = (json.dumps(dialog, ensure_ascii=False) + '\n').encode('utf-8')
+        self._file.seek(self._offsets[-1])
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def __getitem__(self, dialog_id: int) -> List[str]:
+        if not 0 <= dialog_id < len(self):
+            raise IndexError(f"Unknown dialog {dialog_id}")
+        if self._cached[0] != dialog_id:
+            start = self._offsets[dialog_id]
+            self._file.seek(start)
+            dialog = json.loads(self._file.read(self._offsets[dialog_id + 1] - start))
+            self._cached = (dialog_id, dialog)
+        return self._cached[1]
+
+    def close(self):
+        self._file.close()
+
+
+def iter_examples(file_path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Streams the examples of a JSON corpus one at a time, with their context
+    inlined. v2 dialogs are spilled to a temporary file rather than kept in
+    memory, so memory use does not grow with the file in either format.
+    """
+    dialogs = _SpilledDialogs()
+    try:
+        for kind, record in iter_corpus_records(file_path, chunk_size):
+            if kind == 'dialog':
+                dialogs.append(record)
+            elif record.get('dialog_id') is not None:
+                example = {k: v for k, v in record.items() if k not in SPAN_FIELDS}
+                example['context'] = dialogs[record['dialog_id']][record['start']:record['end']]
+                yield example
+            else:
+                yield record if 'context' in record else {**record, 'context': []}
+    finally:
+        dialogs.close()
+
+
+def _read_json_corpus(file_path: str, batch_size: int = LOAD_BATCH_SIZE) -> Tuple[ExampleStore, DialogStore]:
+    """
+    Streams a JSON corpus into the columnar stores without building the whole
+    document. The dialogs are part of the result and stay in memory; the
+    binary format maps them instead.
+    """
+    examples = ExampleStore()
+    dialogs = DialogStore()
+    batch: List[Dict] = []
+    next_id = 0
+
+    def flush():
+        examples.extend(batch)
+        batch.clear()
+
+    for kind, record in iter_corpus_records(file_path):
+        if kind == 'dialog':
+            dialogs.add_dialog(record)
+            continue
+        if 'id' not in record:
+            record = {**record, 'id': next_id}
+        next_id = max(next_id, record['id'] + 1)
+        batch.extend(dialogs.intern([record]))
+        if len(batch) >= batch_size:
+            flush()
+
+    flush()
+    return examples, dialogs
+
+
+def read_corpus(file_path: str) -> Tuple[ExampleStore, DialogStore]:
+    """
+    Reads a binary, v1 or v2 corpus file. Binary corpora are memory-mapped;
+    JSON ones are streamed into the columnar stores, with v1 contexts
+    deduplicated on the way in.
+    """
+    if is_binary_corpus(file_path):
+        return read_binary_corpus(file_path)
+    return _read_json_corpus(file_path)
+
+
+def write_corpus(file_path: str, document: Dict):
+    """Writes a JSON corpus atomically (temporary file + fsync + rename)"""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class CorpusJournal:
+    """
+    Append-only JSON-lines log of changes made since a corpus file was last
+    written in full, stored as `<corpus>.journal`. The first line records the
+    size and mtime of the corpus file it applies to, so a journal left over
+    from an older snapshot is ignored. Records are `{"op": "add", "examples":
+    [...]}` (contexts inlined) and `{"op": "remove", "ids": [...]}`.
+    """
+
+    def __init__(self, corpus_path: str):
+        self.corpus_path = corpus_path
+        self.path = f"{corpus_path}.journal"
+
+    def _base(self) -> Optional[Dict]:
+        try:
+            stat = os.stat(self.corpus_path)
+        except OSError:
+            return None
+        return {'format_version': JOURNAL_FORMAT_VERSION,
+                'base_size': stat.st_size, 'base_mtime_ns': stat.st_mtime_ns}
+
+    def _header(self) -> Optional[Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def can_append(self) -> bool:
+        """A delta is only meaningful on top of an existing full save"""
+        base = self._base()
+        return base is not None and self._header() in (None, base)
+
+    def append(self, records: List[Dict]):
+        if not records:
+            return
+        header = None if os.path.exists(self.path) else self._base()
+        with open(self.path, 'a+', encoding='utf-8') as f:
+            if header is not None:
+                f.write(json.dumps(header) + '\n')
+            elif not self._ends_with_newline():
+                # Terminate a record torn by a crash so it does not swallow the next one
+                f.write('\n')
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if not f.tell():
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def read(self) -> List[Dict]:
+        """Records to replay on top of the corpus file; empty if stale or missing"""
+        header = self._header()
+        if header is None:
+            return []
+        if header != self._base():
+            logging.warning(f"Ignoring journal {self.path}: written for another version of the corpus")
+            return []
+
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            next(f)
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Torn record of an interrupted append
+                    logging.warning(f"Skipping truncated record in {self.path}")
+        return records
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def corpus_signature(corpus_path: str) -> Tuple:
+    """(size, mtime_ns) of a corpus file and of its journal; changes with every write to either"""
+    stamps = []
+    for path in (corpus_path, CorpusJournal(corpus_path).path):
+        try:
+            stat = os.stat(path)
+            stamps.append((stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def snapshot_corpus(file_path: str, examples: Union[List[Dict], ExampleStore],
+                    dialogs: DialogStore) -> Callable[[], None]:
+    """
+    Captures the corpus the way save_corpus writes it and returns a function
+    that writes the capture. Only the capture needs the stores to stay
+    unchanged; the write may run while examples are added or removed.
+    """
+    if file_path.endswith(BINARY_SUFFIX):
+        if not isinstance(examples, ExampleStore):
+            examples = ExampleStore(assign_ids(examples))
+        sections, extras = examples.sections()
+        # Numpy columns only grow past the captured rows, but text buffers are
+        # resized in place by appends, so those are copied
+        sections = {
+            name: bytes(data) if isinstance(data, memoryview) and isinstance(data.obj, bytearray) else data
+            for name, data in sections.items()
+        }
+        sections.update(dialogs.sections())
+        return functools.partial(_write_binary_sections, file_path, sections, extras)
+    return functools.partial(write_corpus, file_path, dialogs.export(examples))
+
+
+def save_corpus(file_path: str, examples: Union[List[Dict], ExampleStore], dialogs: DialogStore):
+    """Writes binary for `*.kbin` paths and JSON v2 otherwise"""
+    snapshot_corpus(file_path, examples, dialogs)()
+
+
+def convert_corpus(source_path: str, target_path: str) -> Dict:
+    """Rewrites a corpus file in the format of the target suffix; returns size statistics"""
+    examples, dialogs = read_corpus(source_path)
+    source_bytes = os.path.getsize(source_path)
+    save_corpus(target_path, examples, dialogs)
+    return {
+        'examples': len(examples),
+        'dialogs': len(dialogs),
+        'dialog_lines': dialogs.line_count(),
+        'source_bytes': source_bytes,
+        'target_bytes': os.path.getsize(target_path),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python -m app.services.corpus SOURCE [TARGET]")
+    print(json.dumps(convert_corpus(sys.argv[1], sys.argv[-1])))
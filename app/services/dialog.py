@@ -0,0 +1,52 @@
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+# Number of most recent dialog lines kept as a pair's context
+CONTEXT_WINDOW = 8
+# How many lines back a translator reply may be from the employer line it answers
+PAIR_LOOKBACK_LINES = 4
+
+
+class DialogProcessor:
+    @staticmethod
+    def extract_role_and_text(line: str) -> Tuple[str, str]:
+        """Extracts role and text from a dialog line"""
+        parts = line.strip().split(']: ', 1)
+        if len(parts) != 2:
+            return None, None
+        role = parts[0].strip('[')
+        text = parts[1].strip()
+        return role, text
+
+    @staticmethod
+    def find_translation_pairs(lines: List[str], context_window: Optional[int] = CONTEXT_WINDOW) -> List[Dict]:
+        """
+        Finds translation pairs in dialog using context
+        Returns a list of dictionaries with corpo-translation pairs and the last
+        `context_window` dialog lines as context (None keeps the whole dialog so far).
+        Single pass over the lines, so parsing is linear and contexts are bounded.
+        """
+        pairs = []
+        context = deque(maxlen=context_window)
+        # Most recent employer line: (line number, text)
+        last_employer = (None, None)
+
+        for i, line in enumerate(lines):
+            role, text = DialogProcessor.extract_role_and_text(line)
+            if role == "Pracodawca":
+                last_employer = (i, text)
+            if not role or not text:
+                continue
+
+            context.append(line)
+
+            employer_line, employer_text = last_employer
+            if role == "Korpotłumacz" and employer_line is not None \
+                    and i - employer_line <= PAIR_LOOKBACK_LINES:
+                pairs.append({
+                    'korpo': employer_text,
+                    'human': text,
+                    'context': list(context)
+                })
+
+        return pairs
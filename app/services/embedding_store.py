@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SIDECAR_FORMAT_VERSION = 1
+DIGEST_SIZE = 16
+DIGEST_DTYPE = f'S{DIGEST_SIZE}'
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=DIGEST_SIZE).digest()
+
+
+def corpus_hash(digests: np.ndarray, model_name: str) -> str:
+    """Hash of the ordered corpus texts together with the model that encoded them"""
+    h = hashlib.sha256(model_name.encode('utf-8'))
+    h.update(np.ascontiguousarray(digests, dtype=DIGEST_DTYPE).tobytes())
+    return h.hexdigest()
+
+
+def _atomic_save_npy(path: str, array: np.ndarray):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class EmbeddingSidecar:
+    """
+    Binary embedding cache stored next to a corpus file.
+
+    `<corpus>.emb.npy` holds the float32 embedding matrix, `<corpus>.emb.keys.npy`
+    the per-row text digests and `<corpus>.emb.json` a manifest with the format
+    version, model name, dimension and corpus hash. Arrays are memory-mapped
+    on load, so a warm start does not read or encode the whole corpus.
+    """
+
+    def __init__(self, corpus_path: str, model_name: str, suffix: str = 'emb'):
+        base = f"{corpus_path}.{suffix}"
+        self.model_name = model_name
+        self.embeddings_path = f"{base}.npy"
+        self.keys_path = f"{base}.keys.npy"
+        self.manifest_path = f"{base}.json"
+
+    def read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get('format_version') != SIDECAR_FORMAT_VERSION:
+            return None
+        if manifest.get('model_name') != self.model_name:
+            return None
+        return manifest
+
+    def load(self) -> Optional[Tuple[dict, np.ndarray, np.ndarray]]:
+        """Returns (manifest, embeddings, digests) memory-mapped, or None if missing/stale"""
+        manifest = self.read_manifest()
+        if manifest is None:
+            return None
+
+        try:
+            embeddings = np.load(self.embeddings_path, mmap_mode='r')
+            digests = np.load(self.keys_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cannot read embedding sidecar {self.embeddings_path}: {e}")
+            return None
+
+        if embeddings.shape[0] != digests.shape[0] or embeddings.shape[0] != manifest.get('count'):
+            return None
+        return manifest, embeddings, digests
+
+    def save(self, embeddings: np.ndarray, digests: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        digests = np.ascontiguousarray(digests, dtype=DIGEST_DTYPE)
+
+        # Manifest is removed first and written last, so a crash in between
+        # leaves no manifest and the sidecar is simply rebuilt
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        _atomic_save_npy(self.embeddings_path, embeddings)
+        _atomic_save_npy(self.keys_path, digests)
+
+        manifest = {
+            'format_version': SIDECAR_FORMAT_VERSION,
+            'model_name': self.model_name,
+            'dimension': int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+            'count': int(embeddings.shape[0]),
+            'corpus_hash': corpus_hash(digests, self.model_name),
+        }
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def text_digests(texts: List[str]) -> np.ndarray:
+    return np.array([text_digest(t) for t in texts], dtype=DIGEST_DTYPE)
+
+
+def encode_texts(texts: List[str], embed_model, dimension: Optional[int] = None) -> np.ndarray:
+    """Encodes texts as a float32 (len(texts), dimension) matrix, also when there are none"""
+    if not len(texts):
+        if dimension is None:
+            dimension = embed_model.get_sentence_embedding_dimension()
+        return np.empty((0, dimension), dtype='float32')
+    return np.asarray(embed_model.encode(list(texts)), dtype='float32')
+
+
+def encode_with_sidecar(texts: List[str], embed_model, sidecar: EmbeddingSidecar,
+                        digests: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Encodes texts using the sidecar as a cache. Returns the memory-mapped
+    sidecar matrix when the corpus is unchanged; otherwise reuses rows whose
+    text digest is already known, encodes only the rest and rewrites the sidecar.
+    """
+    if digests is None:
+        digests = text_digests(texts)
+    if not len(texts):
+        # Nothing to encode or cache; an empty corpus still gets a 2-D matrix
+        manifest = sidecar.read_manifest()
+        return encode_texts(texts, embed_model, manifest and manifest.get('dimension') or None)
+    cached = sidecar.load()
+
+    if cached is not None:
+        manifest, cached_embeddings, cached_digests = cached
+        if manifest['corpus_hash'] == corpus_hash(digests, sidecar.model_name):
+            logging.info(f"Loaded {len(texts)} embeddings from sidecar {sidecar.embeddings_path}")
+            return cached_embeddings
+        known = {bytes(d): row for row, d in enumerate(cached_digests)}
+    else:
+        cached_embeddings = None
+        known = {}
+
+    rows = [known.get(bytes(d)) for d in digests]
+    missing = [i for i, row in enumerate(rows) if row is None]
+
+    new_embeddings = None
+    if missing:
+        new_embeddings = encode_texts([texts[i] for i in missing], embed_model)
+
+    if cached_embeddings is not None:
+        dimension = cached_embeddings.shape[1]
+    else:
+        dimension = new_embeddings.shape[1]
+
+    embeddings = np.empty((len(texts), dimension), dtype='float32')
+    reused = [(i, row) for i, row in enumerate(rows) if row is not None]
+    if reused:
+        target, source = zip(*reused)
+        embeddings[list(target)] = cached_embeddings[list(source)]
+    if missing:
+        embeddings[missing] = new_embeddings
+
+    logging.info(
+        f"Encoded {len(missing)} of {len(texts)} texts, reused {len(reused)} from sidecar")
+    sidecar.save(embeddings, digests)
+    return embeddings
@@ -0,0 +1,307 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.embedding_store import DIGEST_DTYPE, text_digests
+
+TEXT_FIELDS = ('korpo', 'human')
+_STORED_FIELDS = ('id', *TEXT_FIELDS, 'dialog_id', 'start', 'end')
+
+
+def assign_ids(examples: Iterable[Dict], next_id: int = 0) -> List[Dict]:
+    """Returns the examples with an `id`, numbering those without one after the highest id"""
+    examples = list(examples)
+    next_id = max([next_id, *(ex['id'] + 1 for ex in examples if 'id' in ex)])
+    result = []
+    for ex in examples:
+        if 'id' not in ex:
+            ex = {**ex, 'id': next_id}
+            next_id += 1
+        result.append(ex)
+    return result
+
+
+class _Column:
+    """Growable numpy array with amortized O(1) appends"""
+
+    def __init__(self, dtype: str, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    @classmethod
+    def wrap(cls, array: np.ndarray) -> "_Column":
+        """Column over an existing (possibly read-only, memory-mapped) array; copied on first append"""
+        column = cls.__new__(cls)
+        column._data = array
+        column._size = len(array)
+        return column
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self._size]
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        needed = self._size + len(values)
+        if needed > len(self._data):
+            grown = np.empty(max(needed, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self._size] = self.values
+            self._data = grown
+        self._data[self._size:needed] = values
+        self._size = needed
+
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+
+class StringPool:
+    """
+    UTF-8 strings packed into one buffer, addressed by row through an offsets
+    column. The buffer may be a read-only memoryview of a mapped file; it is
+    copied into private memory on the first append.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offsets = _Column('int64')
+        self._offsets.extend([0])
+
+    @classmethod
+    def wrap(cls, offsets: np.ndarray, data) -> "StringPool":
+        pool = cls.__new__(cls)
+        pool._offsets = _Column.wrap(offsets)
+        pool._buffer = data
+        return pool
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def extend(self, strings: Iterable[str]):
+        if not isinstance(self._buffer, bytearray):
+            self._buffer = bytearray(self._buffer)
+        ends = []
+        for s in strings:
+            self._buffer += s.encode('utf-8')
+            ends.append(len(self._buffer))
+        self._offsets.extend(ends)
+
+    def __getitem__(self, row: int) -> str:
+        offsets = self._offsets.values
+        return str(self._buffer[offsets[row]:offsets[row + 1]], 'utf-8')
+
+    def sections(self) -> Tuple[np.ndarray, memoryview]:
+        """(offsets, UTF-8 data) for writing to a binary file"""
+        offsets = self._offsets.values
+        return offsets, memoryview(self._buffer)[:int(offsets[-1])]
+
+    def nbytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes()
+
+
+class _TextView(Sequence):
+    """Lazy sequence of one text field over the given rows - decodes on access"""
+
+    def __init__(self, pool: StringPool, rows: np.ndarray):
+        self._pool = pool
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._pool[int(row)] for row in self._rows[i]]
+        return self._pool[int(self._rows[i])]
+
+
+class ExampleStore:
+    """
+    Columnar storage for translation examples.
+
+    Texts live in per-field string pools, ids, dialog spans and per-field
+    text digests (the keys of the embedding sidecars) in numpy columns, so an
+    example costs its UTF-8 bytes plus a few dozen bytes instead of a dict
+    with boxed strings and ints. Rows are append-only; removal clears a
+    liveness flag and `compact` drops dead rows. Lookups by id use binary
+    search (ids are normally appended in ascending order). Reading an example
+    returns a fresh dict with `id`, the text fields, the dialog span when
+    there is one and any non-standard keys it was stored with.
+
+    A store can also be opened over the sections of a memory-mapped binary
+    corpus (`from_sections`): nothing is read until an example is accessed.
+    """
+
+    def __init__(self, examples: Iterable[Dict] = ()):
+        self._ids = _Column('int64')
+        self._live = _Column('bool')
+        self._texts = {field: StringPool() for field in TEXT_FIELDS}
+        self._digests = {field: _Column(DIGEST_DTYPE) for field in TEXT_FIELDS}
+        # dialog_id -1 means the example has no context
+        self._dialog_ids = _Column('int32')
+        self._starts = _Column('int32')
+        self._ends = _Column('int32')
+        # Rare non-standard keys, by row
+        self._extras: Dict[int, Dict] = {}
+        self._live_count = 0
+        self._ids_sorted = True
+        # argsort of the ids when they are not ascending; stale once rows are appended
+        self._order: Optional[np.ndarray] = None
+        self.extend(examples)
+
+    @classmethod
+    def from_sections(cls, sections: Dict, extras: Optional[Dict[int, Dict]] = None) -> "ExampleStore":
+        """Opens a store over arrays written by `sections` (typically memory-mapped)"""
+        store = cls()
+        ids = sections['ids']
+        store._ids = _Column.wrap(ids)
+        store._live = _Column.wrap(np.ones(len(ids), dtype=bool))
+        for field in TEXT_FIELDS:
+            store._texts[field] = StringPool.wrap(
+                sections[f'{field}.offsets'], sections[f'{field}.data'])
+            store._digests[field] = _Column.wrap(sections[f'{field}.digests'])
+        store._dialog_ids = _Column.wrap(sections['dialog_id'])
+        store._starts = _Column.wrap(sections['start'])
+        store._ends = _Column.wrap(sections['end'])
+        store._extras = dict(extras or {})
+        store._live_count = len(ids)
+        store._ids_sorted = bool(np.all(np.diff(ids) > 0))
+        return store
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    def dead_count(self) -> int:
+        return len(self._ids) - self._live_count
+
+    def extend(self, examples: Iterable[Dict]):
+        examples = list(examples)
+        if not examples:
+            return
+        ids = np.array([ex['id'] for ex in examples], dtype='int64')
+        first_row = len(self._ids)
+        if self._ids_sorted and (np.any(np.diff(ids) <= 0) or
+                                 (first_row and ids[0] <= self._ids.values[-1])):
+            self._ids_sorted = False
+
+        self._ids.extend(ids)
+        self._live.extend(np.ones(len(ids), dtype=bool))
+        for field, pool in self._texts.items():
+            texts = [ex[field] for ex in examples]
+            pool.extend(texts)
+            self._digests[field].extend(text_digests(texts))
+        self._dialog_ids.extend([
+            -1 if ex.get('dialog_id') is None else ex['dialog_id'] for ex in examples])
+        self._starts.extend([ex.get('start') or 0 for ex in examples])
+        self._ends.extend([ex.get('end') or 0 for ex in examples])
+        for row, ex in enumerate(examples, first_row):
+            extra = {k: v for k, v in ex.items() if k not in _STORED_FIELDS}
+            if extra:
+                self._extras[row] = extra
+        self._live_count += len(ids)
+
+    def _row(self, example_id: int) -> Optional[int]:
+        ids = self._ids.values
+        order = None
+        if self._ids_sorted and len(ids):
+            # Dense ids (the usual 0..n-1 numbering) need no search at all
+            row = example_id - int(ids[0])
+            if 0 <= row < len(ids) and ids[row] == example_id:
+                return row if self._live.values[row] else None
+        if not self._ids_sorted:
+            order = self._order
+            if order is None or len(order) != len(ids):
+                order = self._order = np.argsort(ids, kind='stable')
+        live = self._live.values
+        # A removed and re-added id has a dead row before its live one
+        position = int(np.searchsorted(ids, example_id, sorter=order))
+        while position < len(ids):
+            row = position if order is None else int(order[position])
+            if ids[row] != example_id:
+                break
+            if live[row]:
+                return row
+            position += 1
+        return None
+
+    def __contains__(self, example_id: int) -> bool:
+        return self._row(example_id) is not None
+
+    def _record(self, row: int) -> Dict:
+        ex = {'id': int(self._ids.values[row])}
+        for field, pool in self._texts.items():
+            ex[field] = pool[row]
+        dialog_id = int(self._dialog_ids.values[row])
+        if dialog_id >= 0:
+            ex.update(dialog_id=dialog_id, start=int(self._starts.values[row]),
+                      end=int(self._ends.values[row]))
+        extra = self._extras.get(row)
+        if extra:
+            ex.update(extra)
+        return ex
+
+    def get(self, example_id: int) -> Optional[Dict]:
+        row = self._row(example_id)
+        return None if row is None else self._record(row)
+
+    def _live_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._live.values)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in self._live_rows():
+            yield self._record(int(row))
+
+    def ids(self) -> np.ndarray:
+        return self._ids.values[self._live.values].copy()
+
+    def texts(self, field: str) -> List[str]:
+        return list(self.text_view(field))
+
+    def text_view(self, field: str) -> Sequence[str]:
+        return _TextView(self._texts[field], self._live_rows())
+
+    def digests(self, field: str) -> np.ndarray:
+        """Text digests of the live rows, in row order"""
+        if not self.dead_count():
+            return self._digests[field].values
+        return self._digests[field].values[self._live.values]
+
+    def remove(self, example_ids: Iterable[int]) -> int:
+        removed = 0
+        live = self._live.values
+        for example_id in example_ids:
+            row = self._row(example_id)
+            if row is not None:
+                live[row] = False
+                self._extras.pop(row, None)
+                removed += 1
+        self._live_count -= removed
+        return removed
+
+    def compact(self) -> "ExampleStore":
+        """Returns a store holding only the live rows"""
+        return ExampleStore(iter(self))
+
+    def sections(self) -> Tuple[Dict, Dict[int, Dict]]:
+        """Column arrays and extras of the live rows, as read back by `from_sections`"""
+        store = self.compact() if self.dead_count() else self
+        sections = {
+            'ids': store._ids.values,
+            'dialog_id': store._dialog_ids.values,
+            'start': store._starts.values,
+            'end': store._ends.values,
+        }
+        for field in TEXT_FIELDS:
+            offsets, data = store._texts[field].sections()
+            sections[f'{field}.offsets'] = offsets
+            sections[f'{field}.data'] = data
+            sections[f'{field}.digests'] = store._digests[field].values
+        return sections, dict(store._extras)
+
+    def nbytes(self) -> int:
+        columns = (self._ids, self._live, self._dialog_ids, self._starts, self._ends,
+                   *self._digests.values())
+        return (sum(c.nbytes() for c in columns) +
+                sum(pool.nbytes() for pool in self._texts.values()))
@@ -0,0 +1,186 @@
+import logging
+import math
+import time
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ('auto', 'flat', 'hnsw', 'ivfpq')
+
+# 'auto' thresholds: an exact scan is fast enough up to a few tens of thousands
+# of vectors, HNSW up to about half a million, IVF-PQ beyond that
+AUTO_FLAT_MAX = 20_000
+AUTO_HNSW_MAX = 500_000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+# IVF-PQ candidates re-ranked with exact vectors per result wanted
+IVF_REFINE_K_FACTOR = 8
+PQ_BITS = 8
+TRAIN_SAMPLE_PER_LIST = 64
+
+
+def choose_index_kind(count: int) -> str:
+    """
+    Picks a backend for a corpus of the given size.
+
+    Recall against the exact flat scan (benchmarks.index_recall): HNSW stays
+    close to 1.0. PQ codes alone find only about 60% of the true top 10, so
+    IVF-PQ results are re-ranked with the exact vectors of
+    IVF_REFINE_K_FACTOR x k candidates, which brings recall back to about
+    1.0. The price is keeping the full vectors next to the codes, so IVF-PQ
+    is used for its search speed on large corpora, not to save memory.
+    """
+    if count <= AUTO_FLAT_MAX:
+        return 'flat'
+    if count <= AUTO_HNSW_MAX:
+        return 'hnsw'
+    return 'ivfpq'
+
+
+def resolve_index_kind(kind: str, count: int, warn: bool = True) -> str:
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind: {kind}")
+    kind = choose_index_kind(count) if kind == 'auto' else kind
+
+    # IVF-PQ needs enough vectors to train 2^PQ_BITS centroids per subquantizer
+    if kind == 'ivfpq' and count < 2 ** PQ_BITS * 4:
+        if warn:
+            logging.warning(f"Corpus of {count} vectors is too small for IVF-PQ, using flat index")
+        return 'flat'
+    return kind
+
+
+# Backends from exact to most approximate
+_KIND_ORDER = ('flat', 'hnsw', 'ivfpq')
+
+
+def grown_index_kind(kind: str, current: str, count: int) -> Optional[str]:
+    """
+    Backend that a corpus built as `current` should move to now that it holds
+    `count` vectors, or None to keep it. Only moves towards the approximate
+    backends, so a corpus shrinking around a threshold does not flap between
+    rebuilds.
+    """
+    target = resolve_index_kind(kind, count, warn=False)
+    if _KIND_ORDER.index(target) > _KIND_ORDER.index(current):
+        return target
+    return None
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest subquantizer count giving at least 4 dims per code that divides the dimension"""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def _training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    if len(vectors) <= size:
+        return vectors
+    rng = np.random.default_rng(seed)
+    return vectors[np.sort(rng.choice(len(vectors), size, replace=False))]
+
+
+def create_index(vectors: np.ndarray, kind: str = 'auto'):
+    """
+    Creates an empty, trained inner-product FAISS index for L2-normalized vectors.
+
+    'flat' is an exact scan, 'hnsw' a graph index, 'ivfpq' an inverted file
+    with product-quantized codes trained on a sample of `vectors`, whose
+    candidates are re-ranked exactly (IndexRefineFlat); 'auto' picks one by
+    corpus size. Vectors are not added.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    count, dimension = vectors.shape
+    kind = resolve_index_kind(kind, count)
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if kind == 'flat':
+        return faiss.IndexFlatIP(dimension)
+
+    if kind == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, metric)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    nlist = max(1, min(int(4 * math.sqrt(count)), count // 39))
+    quantizer = faiss.IndexFlatIP(dimension)
+    index = faiss.IndexIVFPQ(
+        quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS, metric)
+    sample = _training_sample(
+        vectors, max(nlist * TRAIN_SAMPLE_PER_LIST, 2 ** PQ_BITS * 40))
+    start = time.perf_counter()
+    index.train(sample)
+    index.nprobe = min(IVF_NPROBE, nlist)
+    logging.info(f"Trained IVF-PQ ({nlist} lists) on {len(sample)} vectors in "
+                 f"{time.perf_counter() - start:.2f}s")
+    refined = faiss.IndexRefineFlat(index)
+    refined.k_factor = IVF_REFINE_K_FACTOR
+    return refined
+
+
+def build_index(vectors: np.ndarray, kind: str = 'auto'):
+    """Creates an index with `create_index` and adds the vectors to it"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    start = time.perf_counter()
+    index = create_index(vectors, kind)
+    index.add(vectors)
+    logging.info(
+        f"Built {index_kind_of(index)} index with {len(vectors)} vectors "
+        f"in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def index_kind_of(index) -> str:
+    if isinstance(index, faiss.IndexRefine):
+        return index_kind_of(faiss.downcast_index(index.base_index))
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivfpq'
+    return 'flat'
+
+
+def benchmark_index(vectors: np.ndarray, index, queries: Optional[np.ndarray] = None,
+                    k: int = 10, query_count: int = 200) -> Dict:
+    """
+    Compares an index with an exact flat baseline on the same vectors.
+    Queries default to a sample of the corpus vectors themselves.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    if queries is None:
+        queries = _training_sample(vectors, query_count, seed=1)
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    k = min(k, len(vectors))
+
+    baseline = faiss.IndexFlatIP(vectors.shape[1])
+    baseline.add(vectors)
+
+    def timed_search(idx):
+        start = time.perf_counter()
+        _, ids = idx.search(queries, k)
+        return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+    exact_ids, flat_ms = timed_search(baseline)
+    approx_ids, index_ms = timed_search(index)
+
+    hits = sum(
+        len(set(exact[exact >= 0]) & set(approx[approx >= 0]))
+        for exact, approx in zip(exact_ids, approx_ids))
+
+    return {
+        'index_kind': index_kind_of(index),
+        'vectors': int(len(vectors)),
+        'queries': int(len(queries)),
+        'k': k,
+        f'recall_at_{k}': round(hits / (len(queries) * k), 4),
+        'flat_ms_per_query': round(flat_ms, 4),
+        'index_ms_per_query': round(index_ms, 4),
+        'speedup': round(flat_ms / index_ms, 2) if index_ms else None,
+    }
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+from typing import Optional
+
+import faiss
+
+# 2: IVF-PQ indexes carry an exact re-ranking layer
+SNAPSHOT_FORMAT_VERSION = 2
+
+# IO_FLAG_MMAP_IFC maps flat index codes without copying them (faiss >= 1.9);
+# older builds only support IO_FLAG_MMAP, which maps inverted lists
+_MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class IndexSnapshot:
+    """
+    Prebuilt FAISS index stored next to a corpus file as `<corpus>.faiss`,
+    with a `<corpus>.faiss.json` manifest recording the model, dimension,
+    metric, index kind and corpus hash it was built for. Snapshots are read
+    through mmap, so worker processes on one host share the index pages via
+    the page cache.
+    """
+
+    def __init__(self, corpus_path: str, suffix: str = 'faiss'):
+        self.index_path = f"{corpus_path}.{suffix}"
+        self.manifest_path = f"{self.index_path}.json"
+
+    def read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+            return None
+        return manifest
+
+    def read(self, model_name: str, metric: str, corpus_hash: str, dimension: int,
+             index_kind: str = 'flat', mmap: bool = True):
+        """Returns the snapshot index if it matches the expected manifest, otherwise None"""
+        manifest = self.read_manifest()
+        expected = {
+            'model_name': model_name,
+            'metric': metric,
+            'corpus_hash': corpus_hash,
+            'dimension': dimension,
+            'index_kind': index_kind,
+        }
+        if manifest is None or any(manifest.get(k) != v for k, v in expected.items()):
+            return None
+
+        try:
+            if mmap:
+                try:
+                    index = faiss.read_index(self.index_path, _MMAP_FLAGS)
+                except RuntimeError:
+                    # Not every index type can be memory-mapped
+                    index = faiss.read_index(self.index_path)
+            else:
+                index = faiss.read_index(self.index_path)
+        except RuntimeError as e:
+            logging.warning(f"Cannot read index snapshot {self.index_path}: {e}")
+            return None
+
+        if index.ntotal != manifest.get('count') or index.d != dimension:
+            return None
+
+        logging.info(f"Loaded index snapshot {self.index_path} ({index.ntotal} vectors)")
+        return index
+
+    def write(self, index, model_name: str, metric: str, corpus_hash: str,
+              index_kind: str = 'flat'):
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'model_name': model_name,
+            'metric': metric,
+            'dimension': int(index.d),
+            'count': int(index.ntotal),
+            'index_kind': index_kind,
+            'index_type': type(index).__name__,
+            'corpus_hash': corpus_hash,
+        }
+
+        # Manifest goes last: a reader never sees a manifest for a partial index
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        logging.info(f"Wrote index snapshot {self.index_path} ({index.ntotal} vectors)")
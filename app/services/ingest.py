@@ -0,0 +1,271 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.executors import disk_executor
+
+MANIFEST_FORMAT_VERSION = 3
+
+# Parser processes are not forked from the server process: it runs threads
+# (executor lanes, torch, the HTTP pool) whose locks a fork could copy held
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def list_transcripts(directory_path: str) -> List[str]:
+    return sorted(
+        os.path.abspath(os.path.join(directory_path, filename))
+        for filename in os.listdir(directory_path)
+        if filename.endswith('.txt')
+    )
+
+
+def pair_digest(pair: Dict) -> str:
+    """Identifies the texts of a pair, so a manifest id can be checked against the index"""
+    h = hashlib.blake2b(digest_size=16)
+    for field in ('korpo', 'human'):
+        h.update(pair[field].encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+
+def parse_transcript(file_path: str, parse: Callable[[List[str]], List[Dict]]) -> Dict:
+    """Worker-side: reads, hashes and parses one transcript"""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return {
+            'path': file_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'pairs': parse(data.decode('utf-8').splitlines(keepends=True)),
+            'error': None,
+        }
+    except Exception as e:
+        return {'path': file_path, 'pairs': [], 'error': str(e)}
+
+
+class IngestManifest:
+    """
+    JSON record of ingested transcripts: path -> size, mtime, content hash
+    and the ids of the examples they produced, with a digest of each
+    example's texts (ids are only meaningful in the index that assigned
+    them; the digests tell whether an id still holds that pair). Lets a
+    re-scan skip unchanged files, re-ingest changed ones and retract pairs
+    of deleted ones; it also
+    acts as the resume checkpoint of an interrupted ingestion, since it is
+    written atomically after every committed batch.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('format_version') == MANIFEST_FORMAT_VERSION:
+                self.files = data.get('files', {})
+
+    def get(self, file_path: str) -> Optional[Dict]:
+        return self.files.get(file_path)
+
+    def set(self, file_path: str, entry: Dict):
+        self.files[file_path] = entry
+
+    def pop(self, file_path: str) -> Optional[Dict]:
+        return self.files.pop(file_path, None)
+
+    def paths_under(self, directory_path: str) -> List[str]:
+        prefix = os.path.join(os.path.abspath(directory_path), '')
+        return [path for path in self.files if path.startswith(prefix)]
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format_version': MANIFEST_FORMAT_VERSION, 'files': self.files}, f)
+        os.replace(tmp_path, self.path)
+
+
+class TranscriptIngestor:
+    """
+    Streaming, incremental ingestion of transcript files.
+
+    Files are parsed in a process pool with a bounded number in flight,
+    parsed pairs are grouped into batches of `batch_size` and handed to
+    `add_batch` (which embeds and indexes them and returns their ids), so
+    memory stays bounded by the window and batch size rather than the size
+    of the directory. Files unchanged since the manifest entry (same size
+    and mtime, or same content hash) are not re-ingested as long as their
+    examples are still in the index; changed and deleted files have their
+    old examples retracted through `remove_examples`.
+
+    `get_example(id)` returns the example the index holds under an id. An
+    id from the manifest only counts as the file's example when its texts
+    match the recorded digest - after a reload or with another corpus the
+    same id may hold a different example, which is then neither trusted
+    nor retracted. Without `get_example` the manifest is trusted as is.
+    """
+
+    def __init__(self, parse: Callable[[List[str]], List[Dict]], batch_size: int = 256,
+                 workers: Optional[int] = None, manifest_path: Optional[str] = None):
+        self.parse = parse
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.manifest = IngestManifest(manifest_path)
+
+    @staticmethod
+    def _owned_ids(entry: Dict, get_example: Optional[Callable[[int], Optional[Dict]]]) -> List[int]:
+        """Ids of the entry that still hold the pairs the file produced"""
+        ids = entry.get('ids', [])
+        if get_example is None:
+            return list(ids)
+        owned = []
+        for example_id, digest in zip(ids, entry.get('digests', [])):
+            example = get_example(example_id)
+            if example is not None and pair_digest(example) == digest:
+                owned.append(example_id)
+        return owned
+
+    @classmethod
+    def _all_owned(cls, entry: Dict, get_example) -> bool:
+        return len(cls._owned_ids(entry, get_example)) == len(entry.get('ids', []))
+
+    @staticmethod
+    def _stat_unchanged(file_path: str, entry: Dict) -> bool:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return stat.st_size == entry.get('size') and stat.st_mtime_ns == entry.get('mtime_ns')
+
+    async def ingest_directory(self, directory_path: str,
+                               add_batch: Callable[[List[Dict]], Awaitable[List[int]]],
+                               remove_examples: Callable[[List[int]], Awaitable[int]],
+                               get_example: Optional[Callable[[int], Optional[Dict]]] = None) -> Dict:
+        """Brings the index in line with the directory: new, changed and deleted transcripts"""
+        file_paths = list_transcripts(directory_path)
+        present = set(file_paths)
+
+        retracted = 0
+        for path in self.manifest.paths_under(directory_path):
+            if path not in present:
+                entry = self.manifest.pop(path)
+                owned = self._owned_ids(entry, get_example)
+                retracted += await remove_examples(owned)
+                logging.info(f"Retracted {len(owned)} pairs of deleted {path}")
+
+        stats = await self.ingest(file_paths, add_batch, remove_examples, get_example)
+        stats['retracted'] += retracted
+        return stats
+
+    async def ingest(self, file_paths: List[str],
+                     add_batch: Callable[[List[Dict]], Awaitable[List[int]]],
+                     remove_examples: Optional[Callable[[List[int]], Awaitable[int]]] = None,
+                     get_example: Optional[Callable[[int], Optional[Dict]]] = None) -> Dict:
+        def up_to_date(path: str) -> bool:
+            entry = self.manifest.get(path)
+            return (entry is not None and self._stat_unchanged(path, entry)
+                    and self._all_owned(entry, get_example))
+
+        todo = [path for path in file_paths if not up_to_date(path)]
+        skipped = len(file_paths) - len(todo)
+        if skipped:
+            logging.info(f"Skipping {skipped} unchanged transcripts")
+
+        stats = {'files': 0, 'pairs': 0, 'errors': 0, 'skipped': skipped,
+                 'unchanged_content': 0, 'retracted': 0}
+        start = time.perf_counter()
+        batch: List[Dict] = []
+        # (path, manifest entry, pair count) of files whose pairs sit in `batch`, in order
+        batch_files: List[tuple] = []
+
+        async def flush():
+            ids: List[int] = []
+            for offset in range(0, len(batch), self.batch_size):
+                chunk = batch[offset:offset + self.batch_size]
+                ids.extend(await add_batch(chunk))
+                stats['pairs'] += len(chunk)
+            batch.clear()
+
+            offset = 0
+            for path, entry, count in batch_files:
+                entry['ids'] = ids[offset:offset + count]
+                offset += count
+                self.manifest.set(path, entry)
+            batch_files.clear()
+            self.manifest.save()
+
+            elapsed = time.perf_counter() - start
+            logging.info(
+                f"Ingest progress: {stats['files']}/{len(todo)} files, "
+                f"{stats['pairs']} pairs, {stats['pairs'] / elapsed if elapsed else 0:.0f} pairs/s")
+
+        async def handle(result: Dict):
+            path = result['path']
+            stats['files'] += 1
+            if result['error']:
+                stats['errors'] += 1
+                logging.error(f"Error while processing transcript {path}: {result['error']}")
+                return
+
+            entry = {key: result[key] for key in ('size', 'mtime_ns', 'sha256')}
+            previous = self.manifest.get(path)
+            if previous is not None:
+                owned = self._owned_ids(previous, get_example)
+                if previous.get('sha256') == entry['sha256'] and len(owned) == len(previous.get('ids', [])):
+                    # Touched but not modified: keep the examples, refresh the stat
+                    stats['unchanged_content'] += 1
+                    self.manifest.set(path, {
+                        **entry, 'ids': previous['ids'], 'digests': previous.get('digests', [])})
+                    return
+                if remove_examples is not None and owned:
+                    stats['retracted'] += await remove_examples(owned)
+                self.manifest.pop(path)
+
+            pairs = result['pairs']
+            entry['digests'] = [pair_digest(pair) for pair in pairs]
+            logging.info(f"Found {len(pairs)} translation pairs in {os.path.basename(path)}")
+            batch.extend(pairs)
+            batch_files.append((path, entry, len(pairs)))
+            if len(batch) >= self.batch_size:
+                await flush()
+
+        loop = asyncio.get_running_loop()
+        window = self.workers * 4
+        remaining = iter(todo)
+
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+        pending = set()
+        try:
+            def submit():
+                while len(pending) < window:
+                    path = next(remaining, None)
+                    if path is None:
+                        return
+                    pending.add(loop.run_in_executor(pool, parse_transcript, path, self.parse))
+
+            submit()
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    await handle(future.result())
+                submit()
+        finally:
+            # On errors, parses not yet started are dropped; waiting for the
+            # running ones happens off the event loop
+            for future in pending:
+                future.cancel()
+            await disk_executor.run(pool.shutdown, wait=True, cancel_futures=True)
+
+        await flush()
+        stats['seconds'] = round(time.perf_counter() - start, 2)
+        return stats
@@ -0,0 +1,77 @@
+import asyncio
+import hmac
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from app.core.cache import LRUCache, api_key_digest
+
+PENDING = 'pending'
+READY = 'ready'
+ERROR = 'error'
+
+
+class DeferredNames:
+    """
+    Translation names generated after the translation has been returned.
+
+    `submit` starts the name coroutine as a background task and records it
+    under the translation id; `get` returns the entry, whose status goes from
+    'pending' to 'ready' (with the name) or 'error'. Entries are bounded and
+    expire, so ids that are never fetched do not accumulate. Each entry
+    remembers a digest of its owner's API key and is only returned to the
+    same owner.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = 3600):
+        self._entries = LRUCache(maxsize, ttl)
+        self._tasks: Set[asyncio.Task] = set()
+        self.submitted = 0
+        self.failed = 0
+
+    def submit(self, translation_id: str, owner: str, make_name: Callable[[], Awaitable[str]]):
+        owner = api_key_digest(owner)
+        self._entries.put(translation_id, {'owner': owner, 'status': PENDING, 'name': None})
+        task = asyncio.get_running_loop().create_task(self._run(translation_id, owner, make_name))
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.submitted += 1
+
+    async def _run(self, translation_id: str, owner: str, make_name: Callable[[], Awaitable[str]]):
+        entry = {'owner': owner, 'name': None}
+        try:
+            entry.update(status=READY, name=await make_name())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logging.error(f"Deferred name for translation {translation_id} failed: {e}")
+            entry.update(status=ERROR)
+        self._entries.put(translation_id, entry)
+
+    def get(self, translation_id: str, owner: str) -> Optional[Dict]:
+        entry = self._entries.get(translation_id)
+        if entry is None or not hmac.compare_digest(entry['owner'], api_key_digest(owner)):
+            return None
+        return {'id': translation_id, 'name_status': entry['status'], 'name': entry['name']}
+
+    async def aclose(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            'pending': len(self._tasks),
+            'submitted': self.submitted,
+            'failed': self.failed,
+            'entries': self._entries.stats(),
+        }
+
+
+deferred_names = DeferredNames(
+    maxsize=int(os.getenv('DEFERRED_NAMES_SIZE', '10000')),
+    ttl=float(os.getenv('DEFERRED_NAMES_TTL', '3600')),
+)
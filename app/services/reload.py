@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.executors import disk_executor
+from app.services.corpus import corpus_signature
+from app.services.retrieval import RetrievalEngine, SharedRetrieval, UnsavedChangesError
+
+
+class CorpusReloader:
+    """
+    Picks up a changed corpus file without restarting workers.
+
+    `reload` builds a new engine from the file in the background (through the
+    `build(version)` coroutine, which should run off the event loop) and swaps
+    it into the SharedRetrieval that every translator reads from. Requests
+    in flight keep the engine they already hold, so nothing waits on the
+    build. `watch` polls the size and mtime of the corpus and its journal
+    and reloads when they change. A failed build keeps the current engine.
+
+    Writes made by this process's own engine (full saves and journal
+    appends) are recognized and do not trigger a reload. An engine with
+    unsaved changes is never replaced unless `reload(force=True)` is used,
+    since the rebuilt engine would not contain them.
+    """
+
+    def __init__(self, corpus_path: str, shared: SharedRetrieval,
+                 build: Callable[[int], Awaitable[RetrievalEngine]], interval: float = 10.0):
+        self.corpus_path = corpus_path
+        self.shared = shared
+        self.build = build
+        self.interval = interval
+        self._signature = self.signature()
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.last_reload: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._deferred_signature: Optional[Tuple] = None
+
+    def signature(self) -> Tuple:
+        return corpus_signature(self.corpus_path)
+
+    async def reload(self, force: bool = False) -> Dict:
+        """
+        Builds the engine from the current file and swaps it in. Raises
+        UnsavedChangesError if the current engine has unsaved changes,
+        unless `force` is set.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            current = self.shared.engine
+            if not force and current is not None and current.has_unsaved_changes:
+                raise UnsavedChangesError(
+                    f"Not reloading {self.corpus_path}: v{current.version} has unsaved changes")
+
+            signature = self.signature()
+            start = time.perf_counter()
+            try:
+                engine = await self.build(self.shared.next_version())
+                # Checked again: changes may have landed during the build. Off the
+                # loop, since the check waits for a save in progress to finish
+                await disk_executor.run(self.shared.swap, engine, require_saved=not force)
+            except Exception as e:
+                self.last_error = str(e)
+                logging.error(f"Reload of {self.corpus_path} failed, keeping v{self.shared.version}: {e}")
+                raise
+            self._signature = signature
+            self.reloads += 1
+            self.last_reload = time.time()
+            self.last_duration = round(time.perf_counter() - start, 3)
+            self.last_error = None
+            logging.info(f"Reloaded {self.corpus_path} as v{engine.version} in {self.last_duration}s")
+            return {'version': engine.version, 'examples': len(engine), 'seconds': self.last_duration}
+
+    async def check(self) -> bool:
+        """Reloads if the file was changed by someone else; returns whether it reloaded"""
+        signature = self.signature()
+        if signature == self._signature:
+            return False
+
+        engine = self.shared.engine
+        if engine is None:
+            # Nothing loaded yet - the first load reads the new file anyway
+            self._signature = signature
+            return False
+        if engine.saving:
+            # Our own save is in progress; look again once it is done
+            return False
+        if signature == engine.saved_signature(self.corpus_path):
+            # Written by this process - the engine already holds these changes
+            self._signature = signature
+            return False
+
+        try:
+            await self.reload()
+            return True
+        except UnsavedChangesError as e:
+            # Retried on every check until the changes are saved
+            if signature != self._deferred_signature:
+                self._deferred_signature = signature
+                logging.warning(f"{e}; save them or force a reload to pick up the external change")
+        except Exception:
+            # Already logged; retried on the next change
+            self._signature = signature
+        return False
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self.watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            'watching': self._task is not None,
+            'interval': self.interval,
+            'reloads': self.reloads,
+            'last_reload': self.last_reload,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,584 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+
+from app.core.cache import LRUCache
+from app.services.corpus import (
+    CorpusJournal, DialogStore, corpus_signature, read_corpus, snapshot_corpus)
+from app.services.embedding_store import (
+    EmbeddingSidecar, corpus_hash, encode_texts, encode_with_sidecar)
+from app.services.example_store import ExampleStore, assign_ids
+from app.services.index_factory import create_index, grown_index_kind, resolve_index_kind
+from app.services.index_snapshot import IndexSnapshot
+
+
+class _ReadWriteLock:
+    """Many concurrent searches, exclusive add/remove"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class RetrievalEngine:
+    """
+    The example corpus plus, for every searchable field, the embeddings and
+    the FAISS index built over them.
+
+    `korpo` serves to_human queries (corporate speak in), `human` serves
+    to_korpo queries (plain Polish in), so each direction compares like with like.
+    Indexes hold L2-normalized vectors, so inner-product scores are cosine
+    similarities in [-1, 1].
+
+    Every example carries a stable integer `id` that is also its FAISS id
+    (IndexIDMap2), so examples can be added and removed without a rebuild.
+    Backends that cannot delete vectors (HNSW) keep removed ids as tombstones
+    that are skipped in search results. `version` grows with every change;
+    once the engine is published in a SharedRetrieval, new versions come from
+    its counter, so engines replacing each other never share a version.
+    Indexes memory-mapped from a snapshot are read-only and get copied into
+    private memory on the first change.
+
+    `requested_index_kind` is the kind asked for ('auto' or explicit). Once
+    additions grow the corpus past what the current backend was chosen for,
+    the indexes are rebuilt as the larger backend in a background thread and
+    swapped in, catching up with changes made meanwhile.
+
+    Examples are kept in a columnar ExampleStore (memory-mapped for binary
+    corpora); their contexts live in a DialogStore as spans of deduplicated
+    dialogs, and `materialize` resolves them for the few examples that reach
+    a prompt.
+    """
+
+    METRIC = 'ip'
+    FIELDS = ('korpo', 'human')
+
+    def __init__(self, examples: Union[List[Dict], ExampleStore], embeddings: Dict[str, np.ndarray],
+                 indexes: Dict[str, object], version: int = 0, index_kind: str = 'flat',
+                 mapped_fields: Iterable[str] = (), dialogs: Optional[DialogStore] = None,
+                 requested_index_kind: Optional[str] = None):
+        self.dialogs = dialogs if dialogs is not None else DialogStore()
+        self._examples = examples if isinstance(examples, ExampleStore) else ExampleStore(examples)
+        ids = self._examples.ids()
+        # Embeddings are kept as appended (ids, matrix) chunks, consolidated on save
+        self._embedding_chunks: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {
+            field: [(ids, embeddings[field])] for field in self.FIELDS}
+        self.indexes = indexes
+        self.version = version
+        self.version_source: Optional[Callable[[], int]] = None
+        self.index_kind = index_kind
+        self.requested_index_kind = requested_index_kind or index_kind
+        self._rebuild: Optional[threading.Thread] = None
+        self._rebuild_lock = threading.Lock()
+        self._tombstones = 0
+        self._mapped_fields = set(mapped_fields)
+        self._next_id = int(ids.max()) + 1 if len(ids) else 0
+        self._lock = _ReadWriteLock()
+        self._id_lock = threading.Lock()
+        # ('add' | 'remove', ids) since the corpus file was last written in full
+        self._pending: List[Tuple[str, List[int]]] = []
+        self._save_lock = threading.Lock()
+        # (absolute path, corpus_signature) after the last save by this engine
+        self._saved: Tuple[Optional[str], Optional[Tuple]] = (None, None)
+
+    @property
+    def index(self):
+        return self.indexes['korpo']
+
+    def ids(self) -> np.ndarray:
+        """Ids of the live examples, in storage order"""
+        with self._lock.read():
+            return self._examples.ids()
+
+    def dump_examples(self) -> List[Dict]:
+        """
+        Every example decoded into a dict - for debugging and tests only: it
+        costs time and memory proportional to the corpus and reads every
+        page of a memory-mapped one. Use `len`, `ids` or `get` instead.
+        """
+        with self._lock.read():
+            return list(self._examples)
+
+    def get(self, example_id: int) -> Optional[Dict]:
+        return self._examples.get(example_id)
+
+    def materialize(self, example: Dict) -> Dict:
+        """Copy of the example with its context lines in place of the dialog span"""
+        return self.dialogs.materialize(example)
+
+    def export(self) -> Dict:
+        """The corpus as a deduplicated (format v2) document"""
+        with self._lock.read():
+            return self.dialogs.export(self._examples)
+
+    def save_corpus(self, file_path: str):
+        """
+        Writes the corpus file atomically - binary for `*.kbin` paths, JSON v2
+        otherwise - and drops its journal, which the new file supersedes.
+        The corpus is captured under the lock and written outside it, so
+        changes made during the write are not blocked; they stay pending.
+        """
+        with self._save_lock:
+            with self._lock.read():
+                write = snapshot_corpus(file_path, self._examples, self.dialogs)
+                saved = len(self._pending)
+            write()
+            CorpusJournal(file_path).reset()
+            self._saved_pending(saved, file_path)
+
+    def append_journal(self, file_path: str) -> bool:
+        """
+        Appends the changes since the last full save to the corpus journal.
+        Returns False when there is no full save to build on (the caller
+        should use save_corpus instead).
+        """
+        journal = CorpusJournal(file_path)
+        with self._save_lock:
+            if not journal.can_append():
+                return False
+            with self._lock.read():
+                records = []
+                for op, ids in self._pending:
+                    if op == 'add':
+                        examples = [self._examples.get(i) for i in ids]
+                        records.append({'op': 'add', 'examples': [
+                            self.materialize(ex) for ex in examples if ex is not None]})
+                    else:
+                        records.append({'op': 'remove', 'ids': ids})
+                saved = len(self._pending)
+            journal.append(records)
+            self._saved_pending(saved, file_path)
+        logging.info(f"Appended {len(records)} changes to {journal.path}")
+        return True
+
+    def _saved_pending(self, count: int, file_path: str):
+        """Marks the first `count` pending changes as written (call under the save lock)"""
+        with self._lock.write():
+            del self._pending[:count]
+        self._saved = (os.path.abspath(file_path), corpus_signature(file_path))
+
+    def replay_journal(self, file_path: str, embed_model) -> int:
+        """Applies the corpus journal written after the file's last full save"""
+        records = CorpusJournal(file_path).read()
+        for record in records:
+            if record['op'] == 'add':
+                self.add_examples(record['examples'], embed_model)
+            else:
+                self.remove_examples(record['ids'])
+        # Already persisted in the journal
+        self._pending.clear()
+        if records:
+            logging.info(f"Replayed {len(records)} journal records onto {file_path}")
+        return len(records)
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def _bump_version(self):
+        self.version = self.version_source() if self.version_source else self.version + 1
+
+    @property
+    def has_unsaved_changes(self) -> bool:
+        """Changes made since the corpus file was last written in full or journaled"""
+        return bool(self._pending)
+
+    @property
+    def saving(self) -> bool:
+        return self._save_lock.locked()
+
+    def saved_signature(self, file_path: str) -> Optional[Tuple]:
+        """corpus_signature of the file right after this engine last wrote it"""
+        path, signature = self._saved
+        return signature if path == os.path.abspath(file_path) else None
+
+    @contextmanager
+    def frozen(self):
+        """
+        Waits for a save in progress, then blocks changes and saves (searches
+        still run) for the duration of the block
+        """
+        with self._save_lock, self._lock.write():
+            yield
+
+    assign_ids = staticmethod(assign_ids)
+
+    @staticmethod
+    def _normalized(vectors: np.ndarray) -> np.ndarray:
+        # Copy: sidecar embeddings may be a read-only memory map
+        vectors = np.array(vectors, dtype='float32', copy=True, ndmin=2)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    @classmethod
+    def _build_index(cls, embeddings: np.ndarray, ids: np.ndarray, index_kind: str):
+        vectors = cls._normalized(embeddings)
+        index = faiss.IndexIDMap2(create_index(vectors, index_kind))
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype='int64'))
+        return index
+
+    @staticmethod
+    def _snapshot_key(digests: np.ndarray, ids: np.ndarray, model_name: str) -> str:
+        # Ids live inside the index, so a snapshot must match them as well as the texts
+        h = hashlib.sha256(corpus_hash(digests, model_name).encode('ascii'))
+        h.update(np.ascontiguousarray(ids, dtype='int64').tobytes())
+        return h.hexdigest()
+
+    @classmethod
+    def build(cls, examples: List[Dict], embed_model, version: int = 0,
+              embeddings: Optional[Dict[str, np.ndarray]] = None,
+              index_kind: str = 'auto') -> "RetrievalEngine":
+        """Builds cosine indexes over every field, encoding texts whose embeddings are not given"""
+        dialogs = DialogStore()
+        examples = dialogs.intern(cls.assign_ids(examples))
+        ids = np.array([ex['id'] for ex in examples], dtype='int64')
+        requested_index_kind, index_kind = index_kind, resolve_index_kind(index_kind, len(examples))
+        embeddings = dict(embeddings or {})
+        indexes = {}
+        for field in cls.FIELDS:
+            if field not in embeddings:
+                embeddings[field] = encode_texts([ex[field] for ex in examples], embed_model)
+            indexes[field] = cls._build_index(embeddings[field], ids, index_kind)
+
+        logging.info(f"Built {index_kind} retrieval index v{version} with {len(examples)} examples")
+        return cls(examples, embeddings, indexes, version, index_kind, dialogs=dialogs,
+                   requested_index_kind=requested_index_kind)
+
+    @classmethod
+    def build_from_file(cls, file_path: str, embed_model, model_name: str,
+                        version: int = 0, index_kind: str = 'auto') -> "RetrievalEngine":
+        """
+        Loads a corpus file, reusing its embedding sidecars and index snapshots
+        where they match the corpus; stale or missing artifacts are rebuilt.
+        """
+        examples, dialogs = read_corpus(file_path)
+        ids = examples.ids()
+        requested_index_kind, index_kind = index_kind, resolve_index_kind(index_kind, len(examples))
+        embeddings = {}
+        indexes = {}
+        mapped_fields = []
+        for field in cls.FIELDS:
+            # Stored digests validate sidecars and snapshots; texts are decoded
+            # only for rows that actually need encoding
+            digests = examples.digests(field)
+            embeddings[field] = encode_with_sidecar(
+                examples.text_view(field), embed_model,
+                EmbeddingSidecar(file_path, model_name, suffix=f'{field}.emb'), digests=digests)
+
+            key = cls._snapshot_key(digests, ids, model_name)
+            snapshot = IndexSnapshot(file_path, suffix=f'{field}.faiss')
+            index = snapshot.read(
+                model_name, cls.METRIC, key, int(embeddings[field].shape[1]), index_kind)
+            if index is None:
+                index = cls._build_index(embeddings[field], ids, index_kind)
+                snapshot.write(index, model_name, cls.METRIC, key, index_kind)
+            else:
+                mapped_fields.append(field)
+            indexes[field] = index
+
+        if not len(examples):
+            logging.warning(f"Corpus {file_path} has no examples, starting with an empty index")
+        logging.info(f"Loaded {index_kind} retrieval index v{version} with {len(examples)} examples")
+        engine = cls(examples, embeddings, indexes, version, index_kind, mapped_fields, dialogs,
+                     requested_index_kind)
+        engine.replay_journal(file_path, embed_model)
+        return engine
+
+    def _embeddings_for(self, field: str, ids: np.ndarray) -> np.ndarray:
+        """Embedding rows of the given ids, in that order"""
+        chunks = self._embedding_chunks[field]
+        chunk_ids = np.concatenate([chunk for chunk, _ in chunks])
+        matrix = np.concatenate([np.asarray(m, dtype='float32') for _, m in chunks])
+        order = np.argsort(chunk_ids, kind='stable')
+        rows = order[np.searchsorted(chunk_ids, ids, sorter=order)]
+        return matrix[rows]
+
+    def _make_writable(self):
+        """Copies memory-mapped snapshot indexes into private memory (call under write lock)"""
+        for field in self._mapped_fields:
+            self.indexes[field] = faiss.deserialize_index(faiss.serialize_index(self.indexes[field]))
+        self._mapped_fields.clear()
+
+    def add_examples(self, examples: List[Dict], embed_model) -> List[int]:
+        """Embeds only the new examples and appends them to the live indexes"""
+        if not examples:
+            return []
+
+        # Ids are reserved before encoding, so concurrent adds never share one
+        with self._id_lock:
+            examples = self.assign_ids(examples, self._next_id)
+            ids = np.array([ex['id'] for ex in examples], dtype='int64')
+            if len(set(ids.tolist())) < len(ids):
+                raise ValueError("Example ids must be unique")
+            self._next_id = max(self._next_id, int(ids.max()) + 1)
+
+        # Encoding happens outside the lock - searches keep running meanwhile
+        embeddings = {
+            field: encode_texts([ex[field] for ex in examples], embed_model)
+            for field in self.FIELDS
+        }
+
+        with self._lock.write():
+            # Checked here: explicit ids may race with another add of the same ids
+            if any(i in self._examples for i in ids.tolist()):
+                raise ValueError("Example ids must be new; remove the old example first")
+            examples = self.dialogs.intern(examples)
+            self._make_writable()
+            for field in self.FIELDS:
+                self.indexes[field].add_with_ids(self._normalized(embeddings[field]), ids)
+                self._embedding_chunks[field].append((ids, embeddings[field]))
+            self._examples.extend(examples)
+            self._pending.append(('add', ids.tolist()))
+            self._bump_version()
+
+        logging.info(f"Added {len(examples)} examples, retrieval index now v{self.version}")
+        self._maybe_grow_index()
+        return ids.tolist()
+
+    def _maybe_grow_index(self):
+        """Starts a background rebuild when the corpus has outgrown its backend"""
+        with self._rebuild_lock:
+            if self._rebuild is not None and self._rebuild.is_alive():
+                return
+            target = grown_index_kind(self.requested_index_kind, self.index_kind, len(self._examples))
+            if target is None:
+                return
+            self._rebuild = threading.Thread(
+                target=self._grow_index, args=(target,), name='index-rebuild', daemon=True)
+            self._rebuild.start()
+
+    def _grow_index(self, index_kind: str):
+        start = time.perf_counter()
+        try:
+            # Built from a snapshot of the live rows while searches and adds go on
+            with self._lock.read():
+                ids = self._examples.ids()
+                embeddings = {field: self._embeddings_for(field, ids) for field in self.FIELDS}
+            indexes = {
+                field: self._build_index(embeddings[field], ids, index_kind) for field in self.FIELDS}
+
+            with self._lock.write():
+                # Catch up with adds and removes made during the build
+                live = self._examples.ids()
+                added = np.setdiff1d(live, ids)
+                removed = np.setdiff1d(ids, live)
+                tombstones = 0
+                for field in self.FIELDS:
+                    if len(added):
+                        indexes[field].add_with_ids(
+                            self._normalized(self._embeddings_for(field, added)), added)
+                    if len(removed):
+                        try:
+                            indexes[field].remove_ids(removed)
+                        except RuntimeError:
+                            tombstones = len(removed)
+                previous = self.index_kind
+                self.indexes = indexes
+                self.index_kind = index_kind
+                self._mapped_fields.clear()
+                self._tombstones = tombstones
+                self._bump_version()
+            logging.info(
+                f"Rebuilt retrieval index {previous} -> {index_kind} with {len(live)} examples "
+                f"in {time.perf_counter() - start:.2f}s, now v{self.version}")
+        except Exception as e:
+            logging.error(f"Rebuilding retrieval index as {index_kind} failed: {e}")
+
+    def wait_for_rebuild(self, timeout: Optional[float] = None) -> bool:
+        """Waits for a background index rebuild; returns False if one is still running"""
+        rebuild = self._rebuild
+        if rebuild is not None:
+            rebuild.join(timeout)
+            return not rebuild.is_alive()
+        return True
+
+    def remove_examples(self, example_ids: Iterable[int]) -> int:
+        """Removes examples by id; returns how many were present"""
+        with self._lock.write():
+            ids = np.array(
+                [i for i in set(example_ids) if i in self._examples], dtype='int64')
+            if not len(ids):
+                return 0
+
+            self._make_writable()
+            tombstoned = False
+            for field in self.FIELDS:
+                try:
+                    self.indexes[field].remove_ids(ids)
+                except RuntimeError:
+                    # No deletion support (HNSW): the vector stays, search skips it
+                    tombstoned = True
+            if tombstoned:
+                self._tombstones += len(ids)
+
+            self._examples.remove(ids.tolist())
+            if self._examples.dead_count() > len(self._examples):
+                self._examples = self._examples.compact()
+            self._pending.append(('remove', ids.tolist()))
+            self._bump_version()
+
+        logging.info(f"Removed {len(ids)} examples, retrieval index now v{self.version}")
+        return len(ids)
+
+    def save_artifacts(self, file_path: str, model_name: str):
+        """Writes the embedding sidecars and index snapshots of a saved corpus file"""
+        with self._lock.read():
+            ids = self._examples.ids()
+            digests = {field: self._examples.digests(field) for field in self.FIELDS}
+            embeddings = {field: self._embeddings_for(field, ids) for field in self.FIELDS}
+            indexes = dict(self.indexes)
+            index_kind = self.index_kind
+            compact = self._tombstones > 0
+
+        for field in self.FIELDS:
+            EmbeddingSidecar(file_path, model_name, suffix=f'{field}.emb').save(
+                embeddings[field], digests[field])
+            # Snapshots never carry tombstones - rebuild from the live embeddings
+            index = self._build_index(embeddings[field], ids, index_kind) \
+                if compact else indexes[field]
+            IndexSnapshot(file_path, suffix=f'{field}.faiss').write(
+                index, model_name, self.METRIC,
+                self._snapshot_key(digests[field], ids, model_name), index_kind)
+
+    def search_scored(self, query_embedding: np.ndarray, k: int,
+                      field: str = 'korpo') -> List[Tuple[int, float]]:
+        """Returns (example id, cosine similarity) of up to k nearest examples, best first"""
+        with self._lock.read():
+            k = min(k, len(self._examples))
+            if k <= 0:
+                return []
+
+            # Over-fetch so tombstoned vectors cannot push out live results
+            fetch = min(k + self._tombstones, self.indexes[field].ntotal)
+            scores, ids = self.indexes[field].search(self._normalized(query_embedding), fetch)
+            hits = [
+                (int(example_id), float(score))
+                for example_id, score in zip(ids[0], scores[0])
+                if example_id in self._examples
+            ]
+        return hits[:k]
+
+    def search(self, query_embedding: np.ndarray, k: int, field: str = 'korpo') -> List[Dict]:
+        """Returns up to k examples whose `field` is nearest to the query"""
+        hits = self.search_scored(query_embedding, k, field)
+        return [ex for ex in (self._examples.get(i) for i, _ in hits) if ex is not None]
+
+
+class UnsavedChangesError(RuntimeError):
+    """Swapping would drop changes the current engine has not saved"""
+
+
+class SharedRetrieval:
+    """
+    Holder for the current RetrievalEngine, referenced by every translator.
+    Readers grab `engine` once per request; incremental changes go through
+    the engine's add/remove, full rebuilds are swapped in with `swap`.
+    `results` caches top-k example ids per (engine version, field, k, query).
+    """
+
+    def __init__(self, result_cache_size: int = 10000, result_cache_ttl: float = 3600):
+        self._engine: Optional[RetrievalEngine] = None
+        self.results = LRUCache(result_cache_size, result_cache_ttl)
+        self._swap_lock = threading.Lock()
+        self._version_lock = threading.Lock()
+        self._last_version = 0
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def engine(self) -> Optional[RetrievalEngine]:
+        return self._engine
+
+    @property
+    def version(self) -> int:
+        return self._engine.version if self._engine else 0
+
+    def next_version(self) -> int:
+        """Monotonic across every engine this holder has published"""
+        with self._version_lock:
+            self._last_version = max(self._last_version, self.version) + 1
+            return self._last_version
+
+    def swap(self, engine: RetrievalEngine, require_saved: bool = False) -> Optional[RetrievalEngine]:
+        """
+        Atomically replaces the current engine and returns the previous one.
+        With require_saved, raises UnsavedChangesError instead of dropping
+        changes the current engine has not written to its corpus file; that
+        check waits for a save in progress, so call it off the event loop.
+        """
+        current = self._engine
+        with current.frozen() if require_saved and current is not None else nullcontext():
+            if require_saved and current is not None and current.has_unsaved_changes:
+                raise UnsavedChangesError(
+                    f"Retrieval engine v{current.version} has changes that are not saved")
+            # Versions of the new engine must not repeat any the old one used
+            engine.version = self.next_version()
+            engine.version_source = self.next_version
+            with self._swap_lock:
+                previous, self._engine = self._engine, engine
+        # Ids from the previous engine are meaningless now
+        self.results.clear()
+        logging.info(f"Swapped retrieval engine to v{engine.version} ({len(engine)} examples)")
+        return previous
+
+    async def ensure_loaded(self, build: Callable[[], Awaitable[RetrievalEngine]]) -> RetrievalEngine:
+        """Builds the engine once; concurrent callers wait for the first build"""
+        if self._engine is not None:
+            return self._engine
+
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+
+        async with self._load_lock:
+            if self._engine is None:
+                self.swap(await build())
+        return self._engine
+
+
+_shared_corpora: Dict[str, SharedRetrieval] = {}
+_shared_corpora_lock = threading.Lock()
+
+
+def get_shared_retrieval(corpus_path: str) -> SharedRetrieval:
+    """Returns the process-wide SharedRetrieval for the given corpus file"""
+    key = os.path.abspath(corpus_path)
+    with _shared_corpora_lock:
+        shared = _shared_corpora.get(key)
+        if shared is None:
+            shared = _shared_corpora[key] = SharedRetrieval()
+        return shared
+
@@ -1,67 +1,39 @@
 from typing import List, Dict, Tuple, Optional
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-import faiss
-import asyncio
 import logging
 from enum import Enum
 import emoji
 
+from app.core.config import settings
+from app.core.embeddings import get_embedding_model
+from app.core.llm import get_llm_client
+from app.core.tasks import TASK_NAME, TASK_TRANSLATE, translate_and_name
+from app.services.dialog import DialogProcessor
+
+# Appended as a system message when translation and name come from a single completion
+COMBINED_NAMING_INSTRUCTIONS = """
+Besides the translation, give it a short, unique name (max few words) that considers the original
+text, translation, and context. It can be humorous or creative.
+Answer with a JSON object only, no other text: {"translation": "<translation>", "name": "<name>"}"""
+
 class TranslationState(str, Enum):
     IDLE = "idle" + " " + emoji.emojize(":zzz:")
     LOADING = "loading" + " " + emoji.emojize(":hourglass_flowing_sand:")
     ERROR = "error" + " " + emoji.emojize(":warning:")
     SUCCESS = "success" + " " + emoji.emojize(":check_mark_button:")
 
-class DialogProcessor:
-    @staticmethod
-    def extract_role_and_text(line: str) -> Tuple[str, str]:
-        """Extracts role and text from a dialog line 🎭"""
-        parts = line.strip().split(']: ', 1)
-        if len(parts) != 2:
-            return None, None
-        role = parts[0].strip('[')
-        text = parts[1].strip()
-        return role, text
-
-    @staticmethod
-    def find_translation_pairs(lines: List[str]) -> List[Dict]:
-        """
-        Finds translation pairs in dialog using context 🔍
-        Returns a list of dictionaries with corpo-translation pairs and full context
-        """
-        pairs = []
-        buffer = []
-
-        for i, line in enumerate(lines):
-            role, text = DialogProcessor.extract_role_and_text(line)
-            if not role or not text:
-                continue
-
-            buffer.append(line)
-
-            if role == "Korpotłumacz":
-                for j in range(i-1, max(-1, i-5), -1):
-                    prev_role, prev_text = DialogProcessor.extract_role_and_text(lines[j])
-                    if prev_role == "Pracodawca":
-                        pairs.append({
-                            'korpo': prev_text,
-                            'human': text,
-                            'context': buffer.copy()
-                        })
-                        break
-
-        return pairs
-
 class TranslationService:
-    def __init__(self, api_key: str, model_name: str = "gpt-4"):
+    def __init__(self, api_key: str, model_name: str = "gpt-4", combined_naming: Optional[bool] = None,
+                 task_models: Optional[Dict[str, str]] = None):
         """Initialize translation service with OpenAI and embedding model 🚀"""
         self.state = TranslationState.IDLE
         self.error_message = None
         try:
-            self.client = OpenAI(api_key=api_key)
+            self.client = get_llm_client(api_key)
             self.model_name = model_name
-            self.embed_model = SentenceTransformer('all-MiniLM-L6-v2')
+            # Per-task models (translate, name, ...); tasks without an entry use model_name
+            self.task_models = {**settings.OPENAI_TASK_MODELS, **(task_models or {})}
+            self.combined_naming = settings.COMBINED_NAMING if combined_naming is None else combined_naming
+            self.embed_model = get_embedding_model()
             self.index = None
             self.examples: List[Dict] = []
             self.processor = DialogProcessor()
@@ -72,6 +44,9 @@ class TranslationService:
             logging.error(f"{emoji.emojize(':warning:')} Error initializing translation service: {e}")
             raise
 
+    def model_for(self, task: str) -> str:
+        return self.task_models.get(task, self.model_name)
+
     async def generate_translation_name(self, original_text: str, translation: str, context: str = "") -> str:
         """Generates a unique name for the translation based on content 🏷️"""
         try:
@@ -87,13 +62,11 @@ class TranslationService:
             Translation name:
             """
             
-            response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=50
-                )
+            response = await self.client.create_chat_completion(
+                model=self.model_for(TASK_NAME),
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=50
             )
             
             name = response.choices[0].message.content.strip()
@@ -103,7 +76,34 @@ class TranslationService:
             logging.error(f"{emoji.emojize(':warning:')} Error generating translation name: {e}")
             return f"Translation_{original_text[:20]}"
 
-    async def translate_to_human(self, text: str, examples: Optional[List[Dict]] = None) -> Dict:
+    async def _complete(self, prompt: str, system: Optional[str] = None) -> str:
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        response = await self.client.create_chat_completion(
+            model=self.model_for(TASK_TRANSLATE),
+            messages=messages,
+            temperature=0.7
+        )
+        return response.choices[0].message.content.strip()
+
+    async def _translate_and_name(self, prompt: str, text: str,
+                                  combined_naming: Optional[bool] = None) -> Tuple[str, str]:
+        """
+        Returns (translation, name) 🧩 With combined naming a single completion
+        answers with both as JSON; the two-call flow is only used when that
+        answer cannot be parsed.
+        """
+        if combined_naming is None:
+            combined_naming = self.combined_naming
+
+        return await translate_and_name(
+            lambda instructions: self._complete(prompt, system=instructions),
+            lambda translation: self.generate_translation_name(text, translation),
+            COMBINED_NAMING_INSTRUCTIONS if combined_naming else None)
+
+    async def translate_to_human(self, text: str, examples: Optional[List[Dict]] = None,
+                                 combined_naming: Optional[bool] = None) -> Dict:
         """Translates corporate speak to human language 🔄"""
         self.state = TranslationState.LOADING
         try:
@@ -119,16 +119,7 @@ class TranslationService:
 
             Translation:"""
 
-            response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7
-                )
-            )
-
-            translation = response.choices[0].message.content.strip()
-            name = await self.generate_translation_name(text, translation)
+            translation, name = await self._translate_and_name(prompt, text, combined_naming)
             
             self.state = TranslationState.SUCCESS
             logging.info(f"{emoji.emojize(':white_check_mark:')} Successfully translated to human")
@@ -151,7 +142,8 @@ class TranslationService:
                 "error": str(e)
             }
 
-    async def translate_to_corpo(self, text: str, examples: Optional[List[Dict]] = None) -> Dict:
+    async def translate_to_corpo(self, text: str, examples: Optional[List[Dict]] = None,
+                                 combined_naming: Optional[bool] = None) -> Dict:
         """Translates human language to corporate speak 🔄"""
         self.state = TranslationState.LOADING
         try:
@@ -167,16 +159,7 @@ class TranslationService:
 
             Translation:"""
 
-            response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7
-                )
-            )
-
-            translation = response.choices[0].message.content.strip()
-            name = await self.generate_translation_name(text, translation)
+            translation, name = await self._translate_and_name(prompt, text, combined_naming)
             
             self.state = TranslationState.SUCCESS
             logging.info(f"{emoji.emojize(':white_check_mark:')} Successfully translated to corpo")
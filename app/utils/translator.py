@@ -1,10 +1,11 @@
 import os
 from typing import Dict, Tuple
 import time
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
 import logging
 from app.core.config import settings
+from app.core.embeddings import get_embedding_model
+from app.core.llm import get_llm_client
+from app.core.tasks import TASK_TRANSLATE
 
 # Cache for translator instances
 translator_instances: Dict[str, Tuple[KorpoTlumacz, float]] = {}
@@ -21,9 +22,9 @@ class KorpoTlumacz:
         self.state = TranslatorState.IDLE
         self.error_message = None
         try:
-            self.client = OpenAI(api_key=api_key)
+            self.client = get_llm_client(api_key)
             self.model_name = model_name
-            self.embed_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embed_model = get_embedding_model()
             self.examples = []
             self._set_state(TranslatorState.IDLE)
         except Exception as e:
@@ -50,7 +51,7 @@ class KorpoTlumacz:
             {"role": "user", "content": f"Przetłumacz następujący tekst z korpomowy na prosty język polski:\n\nTekst: {korpo_text}\n\nKontekst: {context if context else 'Brak dodatkowego kontekstu'}"}
         ]
 
-        response = await self.client.chat.completions.create(
+        response = await self.client.create_chat_completion(
             model=self.model_name,
             messages=messages,
             temperature=0.7,
@@ -75,7 +76,7 @@ class KorpoTlumacz:
             {"role": "user", "content": f"Przetłumacz następujący tekst z prostego języka polskiego na korpomowę:\n\nTekst: {human_text}\n\nKontekst: {context if context else 'Brak dodatkowego kontekstu'}"}
         ]
 
-        response = await self.client.chat.completions.create(
+        response = await self.client.create_chat_completion(
             model=self.model_name,
             messages=messages,
             temperature=0.7,
@@ -100,7 +101,7 @@ async def get_translator(api_key: str) -> KorpoTlumacz:
             return translator
     
     # Create new instance
-    translator = KorpoTlumacz(api_key=api_key)
+    translator = KorpoTlumacz(api_key=api_key, model_name=settings.model_for(TASK_TRANSLATE))
     translator_instances[api_key] = (translator, current_time)
     
     return translator
@@ -0,0 +1,75 @@
+"""
+Memory and access cost of the columnar ExampleStore against a list of dicts.
+
+    python -m benchmarks.example_store --examples 200000
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from app.services.example_store import ExampleStore
+
+WORDS = ('synergia', 'deadline', 'feedback', 'zasoby', 'priorytet', 'spotkanie',
+         'wynagrodzenie', 'kwartał', 'inicjatywa', 'proces', 'zespół', 'cel')
+
+
+def synthetic_examples(count: int, seed: int = 0):
+    rng = random.Random(seed)
+
+    def sentence(words: int) -> str:
+        return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+    for i in range(count):
+        yield {'id': i, 'korpo': sentence(rng.randint(12, 30)), 'human': sentence(rng.randint(6, 14)),
+               'dialog_id': i // 8, 'start': i % 8, 'end': i % 8 + 4}
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    container = build()
+    seconds = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return container, current, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--examples', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=100_000)
+    args = parser.parse_args()
+
+    scale = 1_000_000 / args.examples
+    lookup_ids = [random.Random(1).randrange(args.examples) for _ in range(args.lookups)]
+
+    dicts, dict_bytes, dict_seconds = measure(lambda: list(synthetic_examples(args.examples)))
+    by_id = {ex['id']: ex for ex in dicts}
+    del dicts
+    store, store_bytes, store_seconds = measure(
+        lambda: ExampleStore(synthetic_examples(args.examples)))
+
+    def timed(fn):
+        start = time.perf_counter()
+        for example_id in lookup_ids:
+            fn(example_id)
+        return (time.perf_counter() - start) * 1e6 / len(lookup_ids)
+
+    report = {
+        'examples': args.examples,
+        'dicts_mb_per_million': round(dict_bytes * scale / 2**20, 1),
+        'store_mb_per_million': round(store_bytes * scale / 2**20, 1),
+        'dicts_build_seconds': round(dict_seconds, 2),
+        'store_build_seconds': round(store_seconds, 2),
+        'dicts_get_us': round(timed(by_id.get), 3),
+        'store_get_us': round(timed(store.get), 3),
+    }
+    print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
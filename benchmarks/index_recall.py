@@ -0,0 +1,52 @@
+"""
+Recall/latency report of the ANN index backends against the exact flat index.
+
+    python -m benchmarks.index_recall --vectors 200000
+    python -m benchmarks.index_recall --embeddings korpotlumacz_database.json.korpo.emb.npy
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from app.services.index_factory import benchmark_index, build_index
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors - closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    vectors = centers[rng.integers(0, clusters, count)]
+    vectors += 0.5 * rng.standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--embeddings', help='.npy embedding matrix (e.g. an embedding sidecar)')
+    parser.add_argument('--vectors', type=int, default=100_000, help='synthetic corpus size')
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--kinds', default='flat,hnsw,ivfpq')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        vectors = np.array(np.load(args.embeddings), dtype='float32')
+        faiss.normalize_L2(vectors)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dimension)
+
+    for kind in args.kinds.split(','):
+        start = time.perf_counter()
+        index = build_index(vectors, kind)
+        report = benchmark_index(vectors, index, k=args.k, query_count=args.queries)
+        report['build_seconds'] = round(time.perf_counter() - start, 2)
+        print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,32 @@
 import os
 from pathlib import Path
 import logging
-import json
-from openai import OpenAI
-import numpy as np
-from typing import List, Dict, Tuple
-from sentence_transformers import SentenceTransformer
-import faiss
-import asyncio
+from typing import List, Dict, Optional, Tuple
+from functools import partial
+from itertools import islice
+
+from app.core.batching import get_batch_embedder
+from app.core.cache import normalize_query
+from app.core.embeddings import get_embedding_model
+from app.core.executors import bulk_executor, cpu_executor, disk_executor
+from app.core.llm import get_llm_client
+from app.core.tasks import (
+    DEFAULT_TASK_MODELS, TASK_NAME, TASK_TRANSLATE, parse_task_models, translate_and_name)
+from app.services.corpus import DialogStore, iter_examples, save_corpus
+from app.services.dialog import CONTEXT_WINDOW, DialogProcessor
+from app.services.ingest import TranscriptIngestor
+from app.services.naming import PENDING, READY, deferred_names
+from app.services.retrieval import (
+    RetrievalEngine, SharedRetrieval, get_shared_retrieval)
 
 logging.basicConfig(level=logging.INFO,format='%(asctime)s - %(levelname)s - %(message)s')
 
 import uuid
 
-class DialogProcessor:
-    @staticmethod
-    def extract_role_and_text(line: str) -> Tuple[str, str]:
-        """Wydobywa rolę i tekst z linii dialogu"""
-        parts = line.strip().split(']: ', 1)
-        if len(parts) != 2:
-            return None, None
-        role = parts[0].strip('[')
-        text = parts[1].strip()
-        return role, text
-
-    @staticmethod
-    def find_translation_pairs(lines: List[str]) -> List[Dict]:
-        """
-        Znajduje pary tłumaczeń w dialogu, używając kontekstu
-        Zwraca listę słowników z parami korpo-tłumaczenie i pełnym kontekstem
-        """
-        pairs = []
-        buffer = []
-
-        for i, line in enumerate(lines):
-            role, text = DialogProcessor.extract_role_and_text(line)
-            if not role or not text:
-                continue
-
-            buffer.append(line)
-
-            if role == "Korpotłumacz":
-                for j in range(i-1, max(-1, i-5), -1):
-                    prev_role, prev_text = DialogProcessor.extract_role_and_text(
-                        lines[j])
-                    if prev_role == "Pracodawca":
-                        pairs.append({
-                            'korpo': prev_text,
-                            'human': text,
-                            'context': buffer.copy()
-                        })
-                        break
-
-        return pairs
-
+# Dopisywane do promptu systemowego, gdy tłumaczenie i nazwa powstają w jednym zapytaniu
+COMBINED_NAMING_INSTRUCTIONS = """
+Oprócz tłumaczenia nadaj mu krótką, unikalną nazwę (maksymalnie kilka słów), uwzględniającą oryginalny tekst, tłumaczenie i kontekst. Nazwa może być humorystyczna lub kreatywna, nawiązując do stylu "korpo-mowy" i prostego języka.
+Odpowiedz wyłącznie obiektem JSON, bez żadnego innego tekstu: {"translation": "<tłumaczenie>", "name": "<nazwa>"}"""
 
 class TranslatorState:
     IDLE = "idle"
@@ -63,15 +36,45 @@ class TranslatorState:
 
 
 class KorpoTlumacz:
-    def __init__(self, api_key: str, model_name: str = "gpt-4"):
+    def __init__(self, api_key: str, model_name: str = "gpt-4",
+                 embed_model_name: str = 'all-MiniLM-L6-v2',
+                 to_human_k: int = 3, to_korpo_k: int = 2,
+                 min_similarity: float = 0.3, similarity_margin: float = 0.2,
+                 context_min_similarity: float = 0.6,
+                 index_kind: str = os.getenv('RETRIEVAL_INDEX_KIND', 'auto'),
+                 combined_naming: bool = None,
+                 task_models: Dict[str, str] = None):
         self.state = TranslatorState.IDLE
         self.error_message = None
         try:
-            self.client = OpenAI(api_key=api_key)
+            # Asynchroniczny klient OpenAI na wspólnej puli połączeń, z limitem równoległości na klucz
+            self.client = get_llm_client(api_key)
             self.model_name = model_name
-            self.embed_model = SentenceTransformer('all-MiniLM-L6-v2')
-            self.index = None
-            self.examples: List[Dict] = []
+            # Model dla zadania (translate, name, ...); zadania bez wpisu używają model_name
+            self.task_models = {
+                **parse_task_models(os.getenv('LLM_TASK_MODELS', DEFAULT_TASK_MODELS)),
+                **(task_models or {})}
+            self.embed_model_name = embed_model_name
+            # Liczba przykładów w prompcie dla każdego kierunku
+            self.to_human_k = to_human_k
+            self.to_korpo_k = to_korpo_k
+            # Progi podobieństwa kosinusowego: słabsze przykłady są pomijane,
+            # a kontekst rozmowy trafia do promptu tylko dla bardzo bliskich
+            self.min_similarity = min_similarity
+            self.similarity_margin = similarity_margin
+            self.context_min_similarity = context_min_similarity
+            # 'auto' dobiera flat / hnsw / ivfpq do rozmiaru korpusu
+            self.index_kind = index_kind
+            # Tłumaczenie i nazwa w jednym zapytaniu (JSON) zamiast dwóch po kolei
+            # Domyślnie ze zmiennej COMBINED_NAMING - tej samej, którą czyta Settings po stronie FastAPI
+            self.combined_naming = (os.getenv('COMBINED_NAMING', '0') == '1'
+                                    if combined_naming is None else combined_naming)
+            # Model embeddingów jest współdzielony przez wszystkie instancje
+            self.embed_model = get_embedding_model(embed_model_name)
+            # Zapytania z wielu requestów są kodowane razem w jednym batchu
+            self.query_embedder = get_batch_embedder(embed_model_name)
+            # Korpus i index są współdzielone - podpinane w load_examples
+            self.retrieval = SharedRetrieval()
             self.processor = DialogProcessor()
         except Exception as e:
             self.state = TranslatorState.ERROR
@@ -81,6 +84,14 @@ class KorpoTlumacz:
     def _set_state(self, state: str, error_message: str = None):
         self.state = state
         self.error_message = error_message
+
+    def model_for(self, task: str) -> str:
+        return self.task_models.get(task, self.model_name)
+
+    @property
+    def index(self):
+        engine = self.retrieval.engine
+        return engine.index if engine else None
         
     async def generate_translation_name(self, original_text: str, translation: str, context: str = "") -> str:
         """Generuje unikalną nazwę dla tłumaczenia na podstawie treści"""
@@ -96,15 +107,13 @@ class KorpoTlumacz:
             Nazwa tłumaczenia:
             """
             
-            response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": "Jesteś kreatywnym asystentem, który generuje unikalne nazwy dla tłumaczeń."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.7
-                )
+            response = await self.client.create_chat_completion(
+                model=self.model_for(TASK_NAME),
+                messages=[
+                    {"role": "system", "content": "Jesteś kreatywnym asystentem, który generuje unikalne nazwy dla tłumaczeń."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7
             )
             
             name = response.choices[0].message.content.strip()
@@ -114,81 +123,178 @@ class KorpoTlumacz:
             logging.error(f"Błąd podczas generowania nazwy tłumaczenia: {e}")
             return "nazwa-nie-znaleziona"
         
-    async def load_from_directory(self, directory_path: str):
-        """Wczytuje i przetwarza wszystkie pliki tekstowe z katalogu"""
+    async def load_from_directory(self, directory_path: str, manifest_path: str = None,
+                                  workers: int = None, batch_size: int = 256,
+                                  context_window: int = CONTEXT_WINDOW) -> Dict:
+        """
+        Wczytuje i przetwarza wszystkie pliki tekstowe z katalogu.
+        Pliki są parsowane równolegle w puli procesów, a pary trafiają do indexu
+        partiami. Manifest (domyślnie <katalog>/.ingest_manifest.json) pamięta
+        rozmiar, mtime, hash i id przykładów każdego pliku: ponowne wczytanie
+        przetwarza tylko nowe i zmienione pliki, a przykłady z usuniętych plików
+        wycofuje z indexu. Przerwany import wznawia się od miejsca przerwania.
+        """
         try:
             self._set_state(TranslatorState.LOADING)
             logging.info(f"Wczytuję pliki z katalogu: {directory_path}")
 
-            all_examples = []
-            for filename in os.listdir(directory_path):
-                if filename.endswith('.txt'):
-                    file_path = os.path.join(directory_path, filename)
-                    logging.info(f"Przetwarzam plik: {filename}")
+            if manifest_path is None:
+                manifest_path = os.path.join(directory_path, '.ingest_manifest.json')
+            ingestor = TranscriptIngestor(
+                partial(DialogProcessor.find_translation_pairs, context_window=context_window),
+                batch_size=batch_size,
+                workers=workers, manifest_path=manifest_path)
+            stats = await ingestor.ingest_directory(
+                directory_path, self.add_examples, self.remove_examples,
+                get_example=self._get_example)
+
+            logging.info(f"Łącznie załadowano {stats['pairs']} par tłumaczeń")
+            self._set_state(TranslatorState.SUCCESS)
+            return stats
 
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            lines = f.readlines()
+        except Exception as e:
+            self._set_state(TranslatorState.ERROR, str(e))
+            raise
 
-                        conversation_pairs = DialogProcessor.find_translation_pairs(
-                            lines)
-                        all_examples.extend(conversation_pairs)
+    async def add_examples(self, examples: List[Dict]) -> List[int]:
+        """
+        Dodaje przykłady do współdzielonego indexu - koduje tylko nowe pary.
+        Zwraca nadane id, których można użyć w remove_examples.
+        """
+        if not examples:
+            return []
 
-                        logging.info(
-                            f"Znaleziono {len(conversation_pairs)} par tłumaczeń w pliku {filename}")
-                    except Exception as e:
-                        logging.error(f"Błąd podczas przetwarzania pliku {filename}: {str(e)}")
+        engine = self.retrieval.engine
+        if engine is None:
+            engine = await bulk_executor.run(
+                RetrievalEngine.build, examples, self.embed_model,
+                version=self.retrieval.next_version(), index_kind=self.index_kind)
+            self.retrieval.swap(engine)
+            ids = engine.ids().tolist()
+        else:
+            ids = await bulk_executor.run(engine.add_examples, examples, self.embed_model)
 
-            self.examples.extend(all_examples)
-            logging.info(f"Łącznie załadowano {len(all_examples)} par tłumaczeń")
+        logging.info(f"Zaktualizowano index o {len(ids)} przykładów")
+        return ids
 
-            await self._update_index()
+    async def import_examples(self, file_path: str, batch_size: int = 256) -> int:
+        """
+        Importuje przykłady z eksportu JSON (v1 lub v2) strumieniowo: plik jest
+        czytany kawałkami, a przykłady trafiają partiami do add_examples, więc
+        zużycie pamięci nie zależy od rozmiaru pliku. Przykłady dostają nowe id.
+        Zwraca liczbę zaimportowanych przykładów.
+        """
+        try:
+            self._set_state(TranslatorState.LOADING)
+            examples = (
+                {k: v for k, v in ex.items() if k != 'id'} for ex in iter_examples(file_path))
+            imported = 0
+            while True:
+                # Czytanie i parsowanie pliku poza pętlą zdarzeń
+                batch = await disk_executor.run(lambda: list(islice(examples, batch_size)))
+                if not batch:
+                    break
+                await self.add_examples(batch)
+                imported += len(batch)
+                logging.info(f"Zaimportowano {imported} przykładów z {file_path}")
             self._set_state(TranslatorState.SUCCESS)
-
+            return imported
         except Exception as e:
             self._set_state(TranslatorState.ERROR, str(e))
             raise
 
-    async def _update_index(self):
-        """Aktualizuje index FAISS dla wszystkich przykładów"""
-        if not self.examples:
-            logging.warning("Brak przykładów do zaindeksowania")
-            return
+    def _get_example(self, example_id: int) -> Optional[Dict]:
+        engine = self.retrieval.engine
+        return engine.get(example_id) if engine is not None else None
 
-        texts = [ex['korpo'] for ex in self.examples]
-        embeddings = self.embed_model.encode(texts)
+    async def remove_examples(self, example_ids: List[int]) -> int:
+        """Usuwa przykłady z indexu po id"""
+        engine = self.retrieval.engine
+        if engine is None:
+            return 0
+        return await cpu_executor.run(engine.remove_examples, example_ids)
 
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(np.array(embeddings).astype('float32'))
-
-        logging.info(f"Zaktualizowano index z {len(texts)} przykładami")
-
-    async def find_similar_examples(self, query: str, k: int = 3) -> List[Dict]:
-        """Znajduje najbardziej podobne przykłady do zapytania"""
-        if not self.index:
+    async def find_similar_examples(self, query: str, k: int = 3, field: str = 'korpo') -> List[Dict]:
+        """
+        Znajduje do k przykładów, których pole `field` jest najbardziej podobne do zapytania.
+        'korpo' dla zapytań w korpomowie, 'human' dla zapytań w prostym języku.
+        Zwraca kopie przykładów z polem 'score' (podobieństwo kosinusowe); pomija
+        przykłady poniżej min_similarity lub dużo słabsze od najlepszego.
+        """
+        engine = self.retrieval.engine
+        if engine is None:
             logging.error("Index nie został zainicjalizowany")
             return []
 
-        query_embedding = self.embed_model.encode([query])
-        D, I = self.index.search(
-            np.array(query_embedding).astype('float32'), k)
+        # Powtarzane zapytania nie dotykają modelu ani indexu
+        cache_key = (engine.version, field, k, normalize_query(query))
+        hits = self.retrieval.results.get(cache_key)
+        if hits is None:
+            # Kodowanie i wyszukiwanie są CPU-bound - poza pętlą zdarzeń
+            query_embedding = await self.query_embedder.encode(query)
+            hits = await cpu_executor.run(
+                engine.search_scored, query_embedding[None, :], k, field)
+            self.retrieval.results.put(cache_key, hits)
+
+        if not hits:
+            return []
+
+        cutoff = max(self.min_similarity, hits[0][1] - self.similarity_margin)
+        similar = []
+        for example_id, score in hits:
+            example = engine.get(example_id)
+            # Przykład mógł zostać usunięty po zapisaniu wyniku w cache
+            if example is not None and score >= cutoff:
+                # Kontekst jest wycinany z dialogu dopiero dla trafień
+                similar.append({**engine.materialize(example), 'score': score})
+        return similar
+
+    def _format_example(self, ex: Dict, source_label: str, target_label: str,
+                        source_field: str, target_field: str) -> str:
+        """Formatuje przykład do promptu - kontekst rozmowy tylko dla bardzo podobnych"""
+        text = f"{source_label}: {ex[source_field]}\n{target_label}: {ex[target_field]}"
+        if ex.get('context') and ex.get('score', 1.0) >= self.context_min_similarity:
+            text = "Kontekst rozmowy:\n" + "\n".join(ex['context']) + "\n" + text
+        return text
+
+    async def _complete(self, system: str, prompt: str) -> str:
+        response = await self.client.create_chat_completion(
+            model=self.model_for(TASK_TRANSLATE),
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7
+        )
+        return response.choices[0].message.content.strip()
 
-        similar_examples = []
-        for idx in I[0]:
-            if idx < len(self.examples):
-                similar_examples.append(self.examples[idx])
+    async def _translate_and_name(self, system: str, prompt: str, original_text: str,
+                                  context: str, combined_naming: bool = None) -> Tuple[str, str]:
+        """
+        Zwraca (tłumaczenie, nazwa). W trybie combined_naming jedno zapytanie
+        zwraca oba pola jako JSON; dopiero gdy odpowiedzi nie da się odczytać,
+        tłumaczenie i nazwa są generowane dwoma osobnymi zapytaniami.
+        """
+        if combined_naming is None:
+            combined_naming = self.combined_naming
 
-        return similar_examples
+        return await translate_and_name(
+            lambda instructions: self._complete(system + (instructions or ''), prompt),
+            lambda translation: self.generate_translation_name(original_text, translation, context),
+            COMBINED_NAMING_INSTRUCTIONS if combined_naming else None)
 
-    async def _translate_to_human_internal(self, korpo_text: str, context: str = "") -> str:
-        similar = await self.find_similar_examples(korpo_text)
+    def _defer_name(self, translation_id: str, original_text: str, translation: str, context: str):
+        deferred_names.submit(
+            translation_id, self.client.api_key,
+            lambda: self.generate_translation_name(original_text, translation, context))
+
+    async def _to_human_prompt(self, korpo_text: str, context: str = "") -> Tuple[str, str]:
+        similar = await self.find_similar_examples(korpo_text, k=self.to_human_k, field='korpo')
 
         examples_text = "\n\n".join([
-            f"Kontekst rozmowy:\n" + "\n".join(ex['context']) +
-            f"\nKorpomowa: {ex['korpo']}\nTłumaczenie: {ex['human']}"
+            self._format_example(ex, "Korpomowa", "Tłumaczenie", 'korpo', 'human')
             for ex in similar
-        ])
+        ]) or "(brak podobnych przykładów)"
 
         context_info = f"\nKontekst obecnej sytuacji: {context}" if context else ""
 
@@ -203,49 +309,54 @@ class KorpoTlumacz:
 
         Tłumaczenie (uwzględniając podany kontekst):"""
 
-        response = await asyncio.to_thread(
-            lambda: self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "Jesteś korpotłumaczem, który tłumaczy korporacyjną nowomowę na prosty język ludzki. Twoje tłumaczenia są bezkompromisowe i pokazują prawdziwą intencję wypowiedzi."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
-            )
-        )
+        system = "Jesteś korpotłumaczem, który tłumaczy korporacyjną nowomowę na prosty język ludzki. Twoje tłumaczenia są bezkompromisowe i pokazują prawdziwą intencję wypowiedzi."
+        return system, prompt
 
-        return response.choices[0].message.content.strip()
+    async def _translate_to_human_internal(self, korpo_text: str, context: str = "") -> str:
+        system, prompt = await self._to_human_prompt(korpo_text, context)
+        return await self._complete(system, prompt)
 
-    async def translate_to_human(self, korpo_text: str, context: str = "") -> Dict:
+    async def translate_to_human(self, korpo_text: str, context: str = "",
+                                 combined_naming: bool = None, defer_name: bool = False) -> Dict:
         """Asynchronous translation with state handling"""
         try:
             self._set_state(TranslatorState.LOADING)
 
-            result = await self._translate_to_human_internal(korpo_text, context)
-
-            # Generowanie nazwy na podstawie tłumaczenia
-            translation_name = await self.generate_translation_name(korpo_text, result, context)
+            translation_id = str(uuid.uuid4())
+            system, prompt = await self._to_human_prompt(korpo_text, context)
+            if defer_name:
+                # Nazwa powstaje w tle - do pobrania po id tłumaczenia
+                result = await self._complete(system, prompt)
+                self._defer_name(translation_id, korpo_text, result, context)
+                translation_name, name_status = None, PENDING
+            else:
+                # Tłumaczenie i nazwa - jednym zapytaniem albo dwoma po kolei
+                result, translation_name = await self._translate_and_name(
+                    system, prompt, korpo_text, context, combined_naming)
+                name_status = READY
 
             self._set_state(TranslatorState.SUCCESS)
             return {
+                "id": translation_id,
                 "translation": result,
                 "state": self.state,
                 "original": korpo_text,
                 "context": context,
-                "name": translation_name
+                "name": translation_name,
+                "name_status": name_status
             }
         except Exception as e:
             self._set_state(TranslatorState.ERROR, str(e))
             raise
 
-    async def _translate_to_korpo_internal(self, human_text: str, context: str = "") -> str:
-        similar = await self.find_similar_examples(human_text)
+    async def _to_korpo_prompt(self, human_text: str, context: str = "") -> Tuple[str, str]:
+        # Tekst ludzki porównujemy z ludzką stroną przykładów
+        similar = await self.find_similar_examples(human_text, k=self.to_korpo_k, field='human')
 
         examples_text = "\n\n".join([
-            f"Kontekst rozmowy:\n" + "\n".join(ex['context']) +
-            f"\nLudzki język: {ex['human']}\nKorpomowa: {ex['korpo']}"
+            self._format_example(ex, "Ludzki język", "Korpomowa", 'human', 'korpo')
             for ex in similar
-        ])
+        ]) or "(brak podobnych przykładów)"
 
         context_info = f"\nKontekst obecnej sytuacji: {context}" if context else ""
 
@@ -260,48 +371,66 @@ class KorpoTlumacz:
 
         Korpomowa (uwzględniając podany kontekst):"""
 
-        response = await asyncio.to_thread(
-            lambda: self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "Jesteś korpotłumaczem, który przekształca proste wypowiedzi w profesjonalną korpomowę."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
-            )
-        )
+        system = "Jesteś korpotłumaczem, który przekształca proste wypowiedzi w profesjonalną korpomowę."
+        return system, prompt
 
-        return response.choices[0].message.content.strip()
+    async def _translate_to_korpo_internal(self, human_text: str, context: str = "") -> str:
+        system, prompt = await self._to_korpo_prompt(human_text, context)
+        return await self._complete(system, prompt)
 
-    async def translate_to_korpo(self, human_text: str, context: str = "") -> Dict:
+    async def translate_to_korpo(self, human_text: str, context: str = "",
+                                 combined_naming: bool = None, defer_name: bool = False) -> Dict:
         """Asynchronous translation with state handling"""
         try:
             self._set_state(TranslatorState.LOADING)
 
-            result = await self._translate_to_korpo_internal(human_text, context)
-
-            # Generowanie nazwy na podstawie tłumaczenia
-            translation_name = await self.generate_translation_name(human_text, result, context)
+            translation_id = str(uuid.uuid4())
+            system, prompt = await self._to_korpo_prompt(human_text, context)
+            if defer_name:
+                # Nazwa powstaje w tle - do pobrania po id tłumaczenia
+                result = await self._complete(system, prompt)
+                self._defer_name(translation_id, human_text, result, context)
+                translation_name, name_status = None, PENDING
+            else:
+                # Tłumaczenie i nazwa - jednym zapytaniem albo dwoma po kolei
+                result, translation_name = await self._translate_and_name(
+                    system, prompt, human_text, context, combined_naming)
+                name_status = READY
 
             self._set_state(TranslatorState.SUCCESS)
             return {
+                "id": translation_id,
                 "translation": result,
                 "state": self.state,
                 "original": human_text,
                 "context": context,
-                "name": translation_name  # Zwróć wygenerowaną nazwę
+                "name": translation_name,  # Zwróć wygenerowaną nazwę
+                "name_status": name_status
             }
         except Exception as e:
             self._set_state(TranslatorState.ERROR, str(e))
             raise
 
-    async def save_examples(self, file_path: str):
-        """Zapisuje bazę przykładów do pliku"""
+    async def save_examples(self, file_path: str, delta: bool = False):
+        """
+        Zapisuje bazę przykładów do pliku - poza pętlą zdarzeń, atomowo (plik
+        tymczasowy + fsync + rename), więc przerwany zapis nie psuje bazy.
+        Z delta=True dopisuje do <plik>.journal tylko zmiany od ostatniego
+        pełnego zapisu; journal jest odtwarzany przy load_examples.
+        """
         try:
             self._set_state(TranslatorState.LOADING)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.examples, f, ensure_ascii=False, indent=2)
-            logging.info(f"Zapisano {len(self.examples)} przykładów do {file_path}")
+            engine = self.retrieval.engine
+            if engine is None:
+                await disk_executor.run(save_corpus, file_path, [], DialogStore())
+            elif delta and await disk_executor.run(engine.append_journal, file_path):
+                logging.info(f"Dopisano zmiany bazy przykładów do journala {file_path}")
+            else:
+                # *.kbin - binarny, mapowany w pamięć; inaczej JSON v2 (każdy dialog raz)
+                await disk_executor.run(engine.save_corpus, file_path)
+                # Embeddingi i snapshot indexu - kolejny load_examples nic nie przelicza
+                await disk_executor.run(engine.save_artifacts, file_path, self.embed_model_name)
+                logging.info(f"Zapisano {len(engine)} przykładów do {file_path}")
             self._set_state(TranslatorState.SUCCESS)
         except Exception as e:
             self._set_state(TranslatorState.ERROR, str(e))
@@ -311,10 +440,13 @@ class KorpoTlumacz:
         """Wczytuje przykłady z pliku"""
         try:
             self._set_state(TranslatorState.LOADING)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.examples = json.load(f)
-            await self._update_index()
-            logging.info(f"Wczytano {len(self.examples)} przykładów z {file_path}")
+            # Ten sam plik jest wczytywany i indeksowany raz na proces
+            self.retrieval = get_shared_retrieval(file_path)
+            await self.retrieval.ensure_loaded(
+                lambda: bulk_executor.run(
+                    RetrievalEngine.build_from_file, file_path, self.embed_model,
+                    self.embed_model_name, version=1, index_kind=self.index_kind))
+            logging.info(f"Wczytano {len(self.retrieval.engine)} przykładów z {file_path}")
             self._set_state(TranslatorState.SUCCESS)
         except Exception as e:
             self._set_state(TranslatorState.ERROR, str(e))
@@ -0,0 +1,30 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+
+class HashEmbedder:
+    """Deterministic stand-in for a SentenceTransformer: equal texts, equal vectors"""
+
+    def __init__(self, dimension: int = 16):
+        self.dimension = dimension
+        self.encoded = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts):
+        self.encoded += len(texts)
+        if not len(texts):
+            # Like SentenceTransformer: an empty batch is not 2-D
+            return np.empty((0,), dtype='float32')
+        return np.stack([
+            np.frombuffer(hashlib.sha256(t.encode('utf-8')).digest()[:self.dimension],
+                          dtype='uint8').astype('float32') + 1
+            for t in texts])
+
+
+@pytest.fixture
+def embed_model():
+    return HashEmbedder()
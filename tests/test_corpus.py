@@ -0,0 +1,232 @@
+import json
+import os
+import tracemalloc
+
+from app.services.corpus import (
+    CorpusJournal, DialogStore, convert_corpus, is_binary_corpus, iter_examples, read_corpus, save_corpus)
+from app.services.example_store import assign_ids
+
+DIALOG = [f'[{"Pracodawca" if i % 2 else "Korpotłumacz"}]: linia {i}' for i in range(20)]
+
+
+def windows(lines, size, step=1):
+    return [lines[max(0, end - size):end] for end in range(1, len(lines) + 1, step)]
+
+
+def interned(contexts):
+    store = DialogStore()
+    examples = store.intern(
+        [{'korpo': f'k{i}', 'human': f'h{i}', 'context': c} for i, c in enumerate(contexts)])
+    return store, examples
+
+
+def assert_round_trip(store, examples, contexts):
+    assert [store.context(ex) for ex in examples] == contexts
+    assert [store.materialize(ex)['context'] for ex in examples] == contexts
+    assert all('dialog_id' not in store.materialize(ex) for ex in examples)
+
+
+def test_sliding_windows_share_one_dialog():
+    contexts = windows(DIALOG, 8)
+    store, examples = interned(contexts)
+
+    assert_round_trip(store, examples, contexts)
+    assert len(store) == 1
+    assert store.line_count() == len(DIALOG)
+
+
+def test_windows_with_a_gap_larger_than_the_window_start_a_new_dialog():
+    # Lines 8-13 are never part of any context
+    contexts = [DIALOG[0:4], DIALOG[2:8], DIALOG[14:18], DIALOG[15:20]]
+    store, examples = interned(contexts)
+
+    assert_round_trip(store, examples, contexts)
+    assert len(store) == 2
+    assert store.line_count() == 8 + 6
+
+
+def test_context_whose_first_line_repeats():
+    a, b, c, d = 'A', 'B', 'C', 'D'
+    contexts = [[a, b, a], [a, c], [a, b, a, c, d], [b, a, c]]
+    store, examples = interned(contexts)
+
+    assert_round_trip(store, examples, contexts)
+    assert store.dialogs == [[a, b, a, c, d]]
+
+
+def test_examples_without_context():
+    contexts = [[], DIALOG[:3]]
+    store, examples = interned(contexts)
+
+    assert 'dialog_id' not in examples[0]
+    assert_round_trip(store, examples, contexts)
+
+
+def test_export_keeps_only_referenced_dialogs():
+    contexts = [DIALOG[0:4], DIALOG[14:18], DIALOG[15:19]]
+    store, examples = interned(contexts)
+
+    document = store.export(examples[1:])
+    assert document['format_version'] == 2
+    assert document['dialogs'] == [DIALOG[14:19]]
+    exported = DialogStore(document['dialogs'])
+    assert [exported.context(ex) for ex in document['examples']] == contexts[1:]
+
+    # A later dialog keeps growing after the ones it follows were loaded
+    tail = DIALOG[16:20]
+    exported_examples = exported.intern([{'korpo': 'k', 'human': 'h', 'context': tail}])
+    assert exported.context(exported_examples[0]) == tail
+    assert len(exported) == 1
+
+
+def v1_examples():
+    return [
+        {'korpo': 'Zróbmy quick sync', 'human': 'Pogadajmy', 'context': DIALOG[0:4]},
+        {'korpo': 'Domknijmy case', 'human': 'Skończmy', 'context': DIALOG[1:6],
+         'source': 'transkrypt-1.txt', 'tags': ['meeting', 'ąę']},
+        {'korpo': 'Bez kontekstu', 'human': 'Bez kontekstu', 'context': []},
+        {'korpo': 'Zaadresujmy to', 'human': 'Zajmijmy się', 'context': DIALOG[12:16],
+         'score_hint': 0.5},
+    ]
+
+
+def write_v1(path, examples):
+    path.write_text(json.dumps(examples, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def materialized(examples, dialogs):
+    return [dialogs.materialize(ex) for ex in examples]
+
+
+def test_binary_round_trip_from_v1(tmp_path):
+    source = write_v1(tmp_path / 'corpus.json', v1_examples())
+    target = str(tmp_path / 'corpus.kbin')
+
+    stats = convert_corpus(source, target)
+    assert stats['examples'] == 4
+    assert is_binary_corpus(target) and not is_binary_corpus(source)
+
+    examples, dialogs = read_corpus(target)
+    expected = [{**ex, 'id': i} for i, ex in enumerate(v1_examples())]
+    assert materialized(examples, dialogs) == expected
+    assert examples.get(1)['tags'] == ['meeting', 'ąę']
+
+
+def test_binary_round_trip_skips_removed_rows(tmp_path):
+    examples, dialogs = read_corpus(write_v1(tmp_path / 'corpus.json', v1_examples()))
+    examples.remove([0, 2])
+    target = str(tmp_path / 'corpus.kbin')
+    save_corpus(target, examples, dialogs)
+
+    loaded, loaded_dialogs = read_corpus(target)
+    assert loaded.ids().tolist() == [1, 3]
+    assert loaded.get(0) is None
+    assert materialized(loaded, loaded_dialogs) == [
+        {**ex, 'id': i} for i, ex in enumerate(v1_examples()) if i in (1, 3)]
+
+
+def test_binary_round_trip_of_an_empty_corpus(tmp_path):
+    target = str(tmp_path / 'corpus.kbin')
+    save_corpus(target, [], DialogStore())
+
+    examples, dialogs = read_corpus(target)
+    assert len(examples) == 0 and len(dialogs) == 0
+    assert list(examples) == []
+    assert examples.ids().tolist() == []
+
+
+def test_append_after_mmap(tmp_path):
+    target = str(tmp_path / 'corpus.kbin')
+    convert_corpus(write_v1(tmp_path / 'corpus.json', v1_examples()), target)
+    examples, dialogs = read_corpus(target)
+
+    added = dialogs.intern(assign_ids(
+        [{'korpo': 'Nowy', 'human': 'Nowy', 'context': DIALOG[4:8], 'source': 'nowy.txt'}],
+        len(examples)))
+    examples.extend(added)
+    assert len(dialogs) == 3
+    expected = [{**ex, 'id': i} for i, ex in enumerate(v1_examples())] + [
+        {'korpo': 'Nowy', 'human': 'Nowy', 'context': DIALOG[4:8], 'source': 'nowy.txt', 'id': 4}]
+    assert materialized(examples, dialogs) == expected
+
+    # Rewriting the file that is still mapped
+    save_corpus(target, examples, dialogs)
+    loaded, loaded_dialogs = read_corpus(target)
+    assert materialized(loaded, loaded_dialogs) == expected
+
+
+def test_iter_examples_inlines_v2_contexts(tmp_path):
+    examples, dialogs = read_corpus(write_v1(tmp_path / 'corpus.json', v1_examples()))
+    target = str(tmp_path / 'corpus_v2.json')
+    save_corpus(target, examples, dialogs)
+
+    expected = [{**ex, 'id': i} for i, ex in enumerate(v1_examples())]
+    assert list(iter_examples(target, chunk_size=64)) == expected
+    assert materialized(*read_corpus(target)) == expected
+
+
+def test_iter_examples_streams_v2_in_bounded_memory(tmp_path):
+    dialog_count, lines_per_dialog = 3000, 20
+    path = tmp_path / 'large_v2.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"format_version": 2, "dialogs": [')
+        f.write(','.join(
+            json.dumps([f'[Pracodawca]: dialog {d} linia {i} ' + 'x' * 40
+                        for i in range(lines_per_dialog)])
+            for d in range(dialog_count)))
+        f.write('], "examples": [')
+        f.write(','.join(
+            json.dumps({'korpo': f'k{d}', 'human': f'h{d}', 'dialog_id': d, 'start': 2, 'end': 6})
+            for d in range(dialog_count)))
+        f.write(']}')
+
+    tracemalloc.start()
+    try:
+        count = 0
+        for example in iter_examples(str(path), chunk_size=1 << 16):
+            assert len(example['context']) == 4
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert count == dialog_count
+    assert peak < os.path.getsize(path) / 8
+
+
+def test_journal_is_ignored_once_the_corpus_changes(tmp_path):
+    corpus = write_v1(tmp_path / 'corpus.json', v1_examples())
+    journal = CorpusJournal(corpus)
+    assert journal.can_append()
+    journal.append([{'op': 'remove', 'ids': [0]}])
+    assert journal.read() == [{'op': 'remove', 'ids': [0]}]
+
+    # A full save of another version of the corpus makes the journal stale
+    write_v1(tmp_path / 'corpus.json', v1_examples()[:2])
+    assert journal.read() == []
+    assert not journal.can_append()
+
+
+def test_journal_without_a_corpus_file(tmp_path):
+    journal = CorpusJournal(str(tmp_path / 'missing.json'))
+    assert not journal.can_append()
+    assert journal.read() == []
+
+
+def test_journal_skips_a_torn_record(tmp_path):
+    corpus = write_v1(tmp_path / 'corpus.json', v1_examples())
+    journal = CorpusJournal(corpus)
+    journal.append([{'op': 'remove', 'ids': [0]}])
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "remove", "ids": [1')
+
+    assert journal.read() == [{'op': 'remove', 'ids': [0]}]
+
+    # The next append starts on a fresh line instead of extending the torn one
+    journal.append([{'op': 'remove', 'ids': [2]}])
+    assert journal.read() == [{'op': 'remove', 'ids': [0]}, {'op': 'remove', 'ids': [2]}]
+
+    journal.reset()
+    assert not os.path.exists(journal.path)
+    assert journal.read() == []
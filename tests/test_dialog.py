@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from app.services.dialog import CONTEXT_WINDOW, PAIR_LOOKBACK_LINES, DialogProcessor
+
+
+def reference_pairs(lines, context_window):
+    """The original parser: looks back over the raw lines for every reply, keeps the whole dialog"""
+    pairs = []
+    buffer = []
+    for i, line in enumerate(lines):
+        role, text = DialogProcessor.extract_role_and_text(line)
+        if not role or not text:
+            continue
+        buffer.append(line)
+        if role == "Korpotłumacz":
+            for j in range(i - 1, max(-1, i - PAIR_LOOKBACK_LINES - 1), -1):
+                prev_role, prev_text = DialogProcessor.extract_role_and_text(lines[j])
+                if prev_role == "Pracodawca":
+                    context = buffer if context_window is None else buffer[-context_window:]
+                    pairs.append({'korpo': prev_text, 'human': text, 'context': list(context)})
+                    break
+    return pairs
+
+
+def random_dialog(rng, length):
+    lines = []
+    for i in range(length):
+        kind = rng.random()
+        if kind < 0.35:
+            lines.append(f'[Pracodawca]: synergia {i}\n')
+        elif kind < 0.7:
+            lines.append(f'[Korpotłumacz]: po ludzku {i}\n')
+        elif kind < 0.8:
+            lines.append(f'[Stażysta]: kawa {i}\n')
+        elif kind < 0.9:
+            lines.append(rng.choice(['\n', 'bez roli\n', '[Pracodawca]: \n', '[Korpotłumacz]:  \n']))
+        else:
+            lines.append(f'[Pracodawca]: ]: podwójny separator {i}\n')
+    return lines
+
+
+def reply_after(gap):
+    """An employer line and a reply `gap` lines after it, other speakers in between"""
+    filler = [f'[Stażysta]: kawa {i}' for i in range(gap - 1)]
+    return ['[Pracodawca]: synergia', *filler, '[Korpotłumacz]: po ludzku']
+
+
+def test_reply_within_lookback_is_paired():
+    pairs = DialogProcessor.find_translation_pairs(reply_after(PAIR_LOOKBACK_LINES))
+    assert [(p['korpo'], p['human']) for p in pairs] == [('synergia', 'po ludzku')]
+
+
+def test_reply_beyond_lookback_is_not_paired():
+    assert DialogProcessor.find_translation_pairs(reply_after(PAIR_LOOKBACK_LINES + 1)) == []
+
+
+def test_malformed_lines_count_towards_lookback_but_not_context():
+    lines = ['[Pracodawca]: synergia', '', 'bez roli', '[Stażysta]: ', '[Korpotłumacz]: po ludzku']
+    pairs = DialogProcessor.find_translation_pairs(lines)
+    assert pairs == [{'korpo': 'synergia', 'human': 'po ludzku',
+                      'context': ['[Pracodawca]: synergia', '[Korpotłumacz]: po ludzku']}]
+
+    lines.insert(1, '')
+    assert DialogProcessor.find_translation_pairs(lines) == []
+
+
+def test_reply_pairs_with_the_nearest_employer_line():
+    lines = ['[Pracodawca]: pierwsza', '[Pracodawca]: druga', '[Korpotłumacz]: po ludzku',
+             '[Korpotłumacz]: jeszcze raz']
+    pairs = DialogProcessor.find_translation_pairs(lines)
+    assert [(p['korpo'], p['human']) for p in pairs] == [('druga', 'po ludzku'), ('druga', 'jeszcze raz')]
+
+
+def test_context_is_bounded_by_the_window_and_ends_with_the_reply():
+    lines = [f'[{"Pracodawca" if i % 2 == 0 else "Korpotłumacz"}]: linia {i}' for i in range(40)]
+    pairs = DialogProcessor.find_translation_pairs(lines)
+
+    assert len(pairs) == 20
+    for n, pair in enumerate(pairs):
+        end = 2 * n + 2
+        assert pair['context'] == lines[max(0, end - CONTEXT_WINDOW):end]
+
+    whole = DialogProcessor.find_translation_pairs(lines, context_window=None)
+    assert whole[-1]['context'] == lines
+
+
+@pytest.mark.parametrize('context_window', [None, 1, 3, CONTEXT_WINDOW])
+def test_pairs_match_the_original_parser(context_window):
+    rng = random.Random(context_window or 0)
+    for _ in range(200):
+        lines = random_dialog(rng, rng.randrange(0, 60))
+        assert DialogProcessor.find_translation_pairs(lines, context_window) == \
+            reference_pairs(lines, context_window)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services.ingest import TranscriptIngestor
+from app.services.retrieval import RetrievalEngine
+
+
+def parse_lines(lines):
+    """One pair per line: 'korpo | human'"""
+    pairs = []
+    for line in lines:
+        korpo, _, human = line.strip().partition(' | ')
+        pairs.append({'korpo': korpo, 'human': human, 'context': []})
+    return pairs
+
+
+def write(directory, name, lines):
+    path = directory / name
+    path.write_text(''.join(f'{line}\n' for line in lines), encoding='utf-8')
+    return path
+
+
+def ingest(tmp_path, engine, embed_model):
+    async def add_batch(examples):
+        return engine.add_examples(examples, embed_model)
+
+    async def remove_examples(ids):
+        return engine.remove_examples(ids)
+
+    ingestor = TranscriptIngestor(
+        parse_lines, workers=1, manifest_path=str(tmp_path / 'manifest.json'))
+    return asyncio.run(ingestor.ingest_directory(
+        str(tmp_path / 'transcripts'), add_batch, remove_examples, get_example=engine.get))
+
+
+def texts(engine):
+    return sorted(ex['korpo'] for ex in engine.dump_examples())
+
+
+def setup(tmp_path):
+    transcripts = tmp_path / 'transcripts'
+    transcripts.mkdir()
+    write(transcripts, 'a.txt', ['sync a | rozmowa a'])
+    write(transcripts, 'b.txt', ['case b | sprawa b'])
+    return transcripts
+
+
+def test_rescan_skips_unchanged_and_retracts_deleted(tmp_path, embed_model):
+    transcripts = setup(tmp_path)
+    engine = RetrievalEngine.build([], embed_model)
+
+    assert ingest(tmp_path, engine, embed_model)['pairs'] == 2
+    stats = ingest(tmp_path, engine, embed_model)
+    assert (stats['skipped'], stats['pairs']) == (2, 0)
+
+    os.remove(transcripts / 'b.txt')
+    write(transcripts, 'a.txt', ['sync a2 | rozmowa a2'])
+    stats = ingest(tmp_path, engine, embed_model)
+    assert stats['retracted'] == 2
+    assert texts(engine) == ['sync a2']
+
+
+def test_manifest_ids_of_another_index_are_neither_trusted_nor_retracted(tmp_path, embed_model):
+    transcripts = setup(tmp_path)
+    ingest(tmp_path, RetrievalEngine.build([], embed_model), embed_model)
+
+    # E.g. after a reload: the same ids now hold other examples
+    engine = RetrievalEngine.build([
+        {'korpo': 'obcy 0', 'human': 'obcy 0'}, {'korpo': 'obcy 1', 'human': 'obcy 1'}], embed_model)
+    write(transcripts, 'b.txt', ['case b2 | sprawa b2'])
+    stats = ingest(tmp_path, engine, embed_model)
+
+    assert stats['skipped'] == 0
+    assert stats['retracted'] == 0
+    assert texts(engine) == ['case b2', 'obcy 0', 'obcy 1', 'sync a']
+    # Now recorded against this index
+    assert ingest(tmp_path, engine, embed_model)['skipped'] == 2
+
+
+def test_failed_batch_stops_the_ingestion(tmp_path):
+    setup(tmp_path)
+
+    async def add_batch(examples):
+        raise RuntimeError('embedding failed')
+
+    ingestor = TranscriptIngestor(parse_lines, batch_size=1, workers=1)
+    with pytest.raises(RuntimeError, match='embedding failed'):
+        asyncio.run(ingestor.ingest_directory(str(tmp_path / 'transcripts'), add_batch, None))
+    assert ingestor.manifest.files == {}
@@ -0,0 +1,57 @@
+import asyncio
+
+from app.services.naming import ERROR, PENDING, READY, DeferredNames
+
+
+def test_name_goes_from_pending_to_ready():
+    names = DeferredNames()
+
+    async def main():
+        release = asyncio.Event()
+
+        async def make_name():
+            await release.wait()
+            return 'Szybka rozmowa'
+
+        names.submit('t1', 'sk-owner', make_name)
+        pending = names.get('t1', 'sk-owner')
+        release.set()
+        await asyncio.gather(*names._tasks)
+        return pending, names.get('t1', 'sk-owner')
+
+    pending, ready = asyncio.run(main())
+    assert pending == {'id': 't1', 'name_status': PENDING, 'name': None}
+    assert ready == {'id': 't1', 'name_status': READY, 'name': 'Szybka rozmowa'}
+
+
+def test_failed_name_is_reported_as_error():
+    names = DeferredNames()
+
+    async def main():
+        async def make_name():
+            raise RuntimeError('LLM niedostępny')
+
+        names.submit('t1', 'sk-owner', make_name)
+        await asyncio.gather(*names._tasks)
+        return names.get('t1', 'sk-owner')
+
+    assert asyncio.run(main()) == {'id': 't1', 'name_status': ERROR, 'name': None}
+    assert names.stats()['failed'] == 1
+
+
+def test_entry_is_only_returned_to_its_owner():
+    names = DeferredNames()
+
+    async def main():
+        async def make_name():
+            return 'Szybka rozmowa'
+
+        names.submit('t1', 'sk-owner', make_name)
+        await asyncio.gather(*names._tasks)
+
+    asyncio.run(main())
+    assert names.get('t1', 'sk-someone-else') is None
+    assert names.get('t2', 'sk-owner') is None
+    assert names.get('t1', 'sk-owner')['name'] == 'Szybka rozmowa'
+    # Only a digest of the key is kept
+    assert 'sk-owner' not in repr(names._entries._data)
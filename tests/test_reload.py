@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from app.services import retrieval
+from app.services.reload import CorpusReloader
+from app.services.retrieval import RetrievalEngine, SharedRetrieval, UnsavedChangesError
+
+
+def examples(count, prefix='przykład'):
+    return [{'korpo': f'{prefix} korpo {i}', 'human': f'{prefix} human {i}', 'context': []}
+            for i in range(count)]
+
+
+def setup(tmp_path, embed_model):
+    corpus = str(tmp_path / 'corpus.json')
+    with open(corpus, 'w', encoding='utf-8') as f:
+        json.dump(examples(3), f)
+    shared = SharedRetrieval()
+    shared.swap(RetrievalEngine.build_from_file(corpus, embed_model, 'test'))
+
+    async def build(version):
+        return RetrievalEngine.build_from_file(corpus, embed_model, 'test', version=version)
+
+    return corpus, shared, CorpusReloader(corpus, shared, build, interval=0)
+
+
+def test_own_saves_do_not_trigger_a_reload(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+
+    engine.add_examples(examples(1, prefix='nowy'), embed_model)
+    assert engine.append_journal(corpus)
+    assert not asyncio.run(reloader.check())
+    engine.add_examples(examples(1, prefix='drugi'), embed_model)
+    engine.save_corpus(corpus)
+    assert not asyncio.run(reloader.check())
+
+    assert shared.engine is engine
+    assert reloader.reloads == 0
+
+
+def test_external_change_is_reloaded(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+
+    with open(corpus, 'w', encoding='utf-8') as f:
+        json.dump(examples(5), f)
+    assert asyncio.run(reloader.check())
+    assert shared.engine is not engine
+    assert len(shared.engine) == 5
+
+
+def test_unsaved_changes_block_the_swap(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+    engine.add_examples(examples(1, prefix='nowy'), embed_model)
+
+    with open(corpus, 'w', encoding='utf-8') as f:
+        json.dump(examples(5), f)
+    assert not asyncio.run(reloader.check())
+    assert shared.engine is engine
+    with pytest.raises(UnsavedChangesError):
+        asyncio.run(reloader.reload())
+
+    asyncio.run(reloader.reload(force=True))
+    assert len(shared.engine) == 5
+
+
+def test_changes_during_the_build_block_the_swap(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+    build = reloader.build
+
+    async def build_while_adding(version):
+        engine.add_examples(examples(1, prefix='nowy'), embed_model)
+        return await build(version)
+
+    reloader.build = build_while_adding
+    with pytest.raises(UnsavedChangesError):
+        asyncio.run(reloader.reload())
+    assert shared.engine is engine
+
+
+def test_versions_never_repeat_across_engines(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    old = shared.engine
+    old.save_corpus(corpus)
+
+    asyncio.run(reloader.reload())
+    new = shared.engine
+    # Requests still holding the old engine keep changing it
+    old.add_examples(examples(1, prefix='stary'), embed_model)
+    new.add_examples(examples(1, prefix='nowy'), embed_model)
+    versions = {old.version, new.version}
+    assert len(versions) == 2
+    assert shared.next_version() > max(versions)
+
+
+def test_reload_waits_for_the_engine_off_the_event_loop(tmp_path, embed_model):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+    engine.save_corpus(corpus)
+    held = threading.Event()
+
+    def hold_engine():
+        # Like a long save: the swap has to wait for it
+        with engine._lock.read():
+            held.set()
+            time.sleep(0.5)
+
+    async def main():
+        threading.Thread(target=hold_engine).start()
+        held.wait()
+        reload = asyncio.ensure_future(reloader.reload())
+        longest, last = 0.0, time.perf_counter()
+        while not reload.done():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            longest, last = max(longest, now - last), now
+        await reload
+        return longest
+
+    assert asyncio.run(main()) < 0.25
+    assert shared.engine is not engine
+
+
+def test_changes_during_a_save_stay_pending(tmp_path, embed_model, monkeypatch):
+    corpus, shared, reloader = setup(tmp_path, embed_model)
+    engine = shared.engine
+    writing, release = threading.Event(), threading.Event()
+    snapshot = retrieval.snapshot_corpus
+
+    def slow_snapshot(*args):
+        write = snapshot(*args)
+
+        def slow_write():
+            writing.set()
+            release.wait(5)
+            write()
+        return slow_write
+
+    monkeypatch.setattr(retrieval, 'snapshot_corpus', slow_snapshot)
+    save = threading.Thread(target=engine.save_corpus, args=(corpus,))
+    save.start()
+    writing.wait(5)
+    # Not blocked by the write in progress
+    engine.add_examples(examples(1, prefix='nowy'), embed_model)
+    release.set()
+    save.join()
+
+    assert engine.has_unsaved_changes
+    with open(corpus, encoding='utf-8') as f:
+        assert len(json.load(f)['examples']) == 3
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.corpus import CorpusJournal
+from app.services.index_factory import benchmark_index, build_index
+from app.services.retrieval import RetrievalEngine
+
+EXAMPLES = [
+    {'korpo': 'Zróbmy quick sync', 'human': 'Pogadajmy chwilę', 'context': []},
+    {'korpo': 'Domknijmy ten case', 'human': 'Skończmy to', 'context': []},
+]
+
+
+def query(embed_model, text):
+    return np.asarray(embed_model.encode([text]), dtype='float32')
+
+
+@pytest.mark.parametrize('document', [
+    [],
+    {'format_version': 2, 'dialogs': [], 'examples': []},
+])
+@pytest.mark.parametrize('index_kind', ['auto', 'hnsw', 'ivfpq'])
+def test_empty_corpus_loads_and_accepts_examples(tmp_path, embed_model, document, index_kind):
+    corpus = tmp_path / 'corpus.json'
+    corpus.write_text(json.dumps(document))
+
+    engine = RetrievalEngine.build_from_file(str(corpus), embed_model, 'test', index_kind=index_kind)
+    assert len(engine) == 0
+    assert engine.search_scored(query(embed_model, 'cokolwiek'), 3) == []
+
+    # Artifacts of an empty corpus are written and read back
+    engine.save_artifacts(str(corpus), 'test')
+    engine = RetrievalEngine.build_from_file(str(corpus), embed_model, 'test', index_kind=index_kind)
+    assert len(engine) == 0
+
+    ids = engine.add_examples(EXAMPLES, embed_model)
+    hits = engine.search_scored(query(embed_model, EXAMPLES[1]['korpo']), 1)
+    assert hits[0][0] == ids[1]
+
+
+def test_build_without_examples(embed_model):
+    engine = RetrievalEngine.build([], embed_model)
+    assert len(engine) == 0
+    assert engine.search_scored(query(embed_model, 'cokolwiek'), 3, field='human') == []
+
+
+def make_examples(count, prefix='przykład'):
+    return [{'korpo': f'{prefix} korpo {i}', 'human': f'{prefix} human {i}', 'context': []}
+            for i in range(count)]
+
+
+def assert_finds_all(engine, embed_model, examples, ids):
+    for example, example_id in zip(examples, ids):
+        hits = engine.search_scored(query(embed_model, example['korpo']), 1)
+        assert hits[0][0] == example_id
+
+
+def test_auto_index_grows_past_flat_threshold(monkeypatch, embed_model):
+    monkeypatch.setattr('app.services.index_factory.AUTO_FLAT_MAX', 50)
+    examples = make_examples(40)
+    engine = RetrievalEngine.build(examples, embed_model, index_kind='auto')
+    assert engine.index_kind == 'flat'
+
+    added = make_examples(30, prefix='nowy')
+    added_ids = engine.add_examples(added, embed_model)
+    assert engine.wait_for_rebuild(timeout=30)
+    assert engine.index_kind == 'hnsw'
+    assert engine.requested_index_kind == 'auto'
+    assert_finds_all(engine, embed_model, added, added_ids)
+
+    # The grown index keeps taking changes
+    engine.remove_examples(added_ids[:5])
+    hits = engine.search_scored(query(embed_model, added[0]['korpo']), 3)
+    assert added_ids[0] not in [example_id for example_id, _ in hits]
+
+
+def test_explicit_ivfpq_is_trained_once_the_corpus_is_large_enough(embed_model):
+    engine = RetrievalEngine.build(make_examples(40), embed_model, index_kind='ivfpq')
+    assert engine.index_kind == 'flat'
+
+    engine.add_examples(make_examples(1100, prefix='nowy'), embed_model)
+    assert engine.wait_for_rebuild(timeout=60)
+    assert engine.index_kind == 'ivfpq'
+    assert engine.indexes['korpo'].ntotal == 1140
+
+
+def test_ivfpq_recall_matches_the_flat_baseline():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((32, 32)).astype('float32')
+    vectors = centers[rng.integers(0, 32, 4000)] + 0.5 * rng.standard_normal((4000, 32)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    report = benchmark_index(vectors, build_index(vectors, 'ivfpq'), k=10, query_count=100)
+    assert report['index_kind'] == 'ivfpq'
+    assert report['recall_at_10'] >= 0.95
+
+
+def test_index_rebuild_catches_up_with_concurrent_changes(embed_model):
+    examples = make_examples(40)
+    engine = RetrievalEngine.build(examples, embed_model, index_kind='flat')
+    ids = engine.ids().tolist()
+    late = make_examples(1, prefix='spóźniony')
+    changed = {}
+
+    build_index = engine._build_index
+
+    def build_during_changes(embeddings, index_ids, index_kind):
+        if not changed:
+            changed['added'] = engine.add_examples(late, embed_model)
+            engine.remove_examples(ids[:1])
+        return build_index(embeddings, index_ids, index_kind)
+
+    engine._build_index = build_during_changes
+    engine._grow_index('hnsw')
+
+    assert engine.index_kind == 'hnsw'
+    assert_finds_all(engine, embed_model, late, changed['added'])
+    hits = engine.search_scored(query(embed_model, examples[0]['korpo']), 3)
+    assert ids[0] not in [example_id for example_id, _ in hits]
+
+
+def test_concurrent_adds_get_distinct_ids(embed_model):
+    engine = RetrievalEngine.build(make_examples(1), embed_model)
+    start = threading.Barrier(2)
+
+    class SlowEmbedder:
+        # Both adds are inside encode at the same time
+        def encode(self, texts):
+            start.wait(timeout=10)
+            return embed_model.encode(texts)
+
+    results = []
+
+    def add(i):
+        results.append(engine.add_examples(make_examples(1, prefix=f'wątek {i}'), SlowEmbedder()))
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = sorted(example_id for result in results for example_id in result)
+    assert ids == [1, 2]
+    assert sorted(engine.ids().tolist()) == [0, 1, 2]
+    assert engine.indexes['korpo'].ntotal == 3
+
+
+def test_add_rejects_ids_already_present(embed_model):
+    engine = RetrievalEngine.build(make_examples(2), embed_model)
+    with pytest.raises(ValueError):
+        engine.add_examples([{**make_examples(1, prefix='nowy')[0], 'id': 1}], embed_model)
+    assert len(engine) == 2
+
+
+def test_journal_replay_restores_adds_and_removes(tmp_path, embed_model):
+    corpus = str(tmp_path / 'corpus.json')
+    engine = RetrievalEngine.build(make_examples(5), embed_model)
+    # Without a full save there is nothing for a delta to build on
+    assert not engine.append_journal(corpus)
+    engine.save_corpus(corpus)
+
+    added = make_examples(2, prefix='nowy')
+    added_ids = engine.add_examples(added, embed_model)
+    engine.remove_examples([0, added_ids[0]])
+    assert engine.append_journal(corpus)
+    assert engine._pending == []
+
+    loaded = RetrievalEngine.build_from_file(corpus, embed_model, 'test')
+    assert sorted(loaded.ids().tolist()) == [1, 2, 3, 4, added_ids[1]]
+    assert loaded.get(added_ids[1])['korpo'] == added[1]['korpo']
+    assert_finds_all(loaded, embed_model, added[1:], added_ids[1:])
+    # Replayed changes are already on disk
+    assert loaded._pending == []
+
+    # A full save supersedes the journal
+    loaded.save_corpus(corpus)
+    assert not os.path.exists(CorpusJournal(corpus).path)
+    reloaded = RetrievalEngine.build_from_file(corpus, embed_model, 'test')
+    assert sorted(reloaded.ids().tolist()) == [1, 2, 3, 4, added_ids[1]]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.core.tasks import parse_json_reply, translate_and_name
+
+FIELDS = ('translation', 'name')
+
+
+@pytest.mark.parametrize('content', [
+    '{"translation": "Pogadajmy", "name": "Szybka rozmowa"}',
+    '```json\n{"translation": "Pogadajmy", "name": "Szybka rozmowa"}\n```',
+    '```\n{"translation": "Pogadajmy", "name": "Szybka rozmowa"}\n```',
+    'Oto odpowiedź: {"translation": " Pogadajmy ", "name": "Szybka rozmowa"} Mam nadzieję, że pomogłem.',
+])
+def test_json_reply_is_read_through_fences_and_prose(content):
+    assert parse_json_reply(content, FIELDS) == {'translation': 'Pogadajmy', 'name': 'Szybka rozmowa'}
+
+
+@pytest.mark.parametrize('content', [
+    '',
+    None,
+    'Pogadajmy',
+    '{"translation": "Pogadajmy"}',
+    '{"translation": "Pogadajmy", "name": "  "}',
+    '{"translation": "Pogadajmy", "name": 7}',
+    '{"translation": "Pogadajmy", "name": ',
+    '["Pogadajmy", "Szybka rozmowa"]',
+])
+def test_incomplete_json_reply_is_rejected(content):
+    assert parse_json_reply(content, FIELDS) is None
+
+
+class FakeLLM:
+    """Records calls; the translation completion answers with `reply`"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    async def translate(self, instructions):
+        self.calls.append(('translate', instructions))
+        return self.reply if instructions else 'Pogadajmy'
+
+    async def name(self, translation):
+        self.calls.append(('name', translation))
+        return '"Osobna\\ nazwa"'
+
+
+def test_combined_reply_needs_a_single_call():
+    llm = FakeLLM('{"translation": "Pogadajmy", "name": "\\"Szybka\\" rozmowa"}')
+    result = asyncio.run(translate_and_name(llm.translate, llm.name, 'JSON!'))
+
+    assert result == ('Pogadajmy', 'Szybka rozmowa')
+    assert llm.calls == [('translate', 'JSON!')]
+
+
+@pytest.mark.parametrize('reply', ['Pogadajmy', '{"translation": "Pogadajmy", "name": ""}'])
+def test_unreadable_combined_reply_falls_back_to_two_calls(reply):
+    llm = FakeLLM(reply)
+    result = asyncio.run(translate_and_name(llm.translate, llm.name, 'JSON!'))
+
+    assert result == ('Pogadajmy', 'Osobna nazwa')
+    assert llm.calls == [('translate', 'JSON!'), ('translate', None), ('name', 'Pogadajmy')]
+
+
+def test_without_combined_naming_two_calls_are_made():
+    llm = FakeLLM(None)
+    result = asyncio.run(translate_and_name(llm.translate, llm.name))
+
+    assert result == ('Pogadajmy', 'Osobna nazwa')
+    assert llm.calls == [('translate', None), ('name', 'Pogadajmy')]